@@ -1,37 +1,206 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
 import streamlit as st
+from cachetools import TTLCache
 from sqlalchemy import text
-from database import get_engine, get_next_user_id
+from database import get_engine, read_connection
+import logic
+
+# Statements are built once so SQLAlchemy's compiled cache is reused across calls
+_INSERT_USER = text("""
+INSERT INTO customer_details (user_id, user_name, password, mail_id, phone_number, is_active, role)
+VALUES (nextval('customer_user_id_seq'), :user_name, :password, :mail_id, :phone_number, :is_active, :role)
+ON CONFLICT (user_name) DO NOTHING
+RETURNING user_id
+""")
+_UPDATE_PROFILE = text("""
+UPDATE customer_details
+SET mail_id = :mail_id,
+    phone_number = :phone_number
+WHERE user_id = :user_id
+""")
+_RESET_PASSWORD = text("UPDATE customer_details SET password = :pw, require_password_change = TRUE WHERE user_id = :uid")
+_VERIFY_LOGIN = text("SELECT user_id, password, is_active FROM customer_details WHERE user_name = :user_name")
+_SELECT_PROFILE = text("""
+SELECT user_id, user_name, mail_id, phone_number, role, assigned_stock_type, require_password_change, is_active,
+       COALESCE(price_adjustment_percent, 0)::float8 AS price_adjustment_percent
+FROM customer_details
+WHERE user_id = :uid
+""")
+_UPGRADE_PASSWORD = text("UPDATE customer_details SET password = :pw WHERE user_id = :uid AND password = :old")
+_SELECT_PASSWORD = text("SELECT password FROM customer_details WHERE user_id = :uid")
+_CHANGE_PASSWORD = text("""
+UPDATE customer_details
+SET password = :pw, require_password_change = FALSE
+WHERE user_id = :uid AND password = :cur
+RETURNING user_id
+""")
+
+# Background writes that the login response does not need to wait for
+_BACKGROUND = ThreadPoolExecutor(max_workers=2, thread_name_prefix="auth-bg")
+
+logger = logging.getLogger(__name__)
+
+def _log_background_failure(future):
+    # Nothing waits on these futures, so surface failures here rather than lose them
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Background auth task failed: %s", exc, exc_info=exc)
+
+# Successful logins keyed by (user_name, sha256(password)); evicted on password/account changes.
+# Shared by every session thread and TTLCache is not thread-safe, so all access holds _AUTH_CACHE_LOCK.
+_AUTH_CACHE = TTLCache(maxsize=1024, ttl=900)
+_AUTH_CACHE_LOCK = threading.Lock()
+
+def _auth_cache_key(user_name, password):
+    return (user_name, hashlib.sha256(str(password).encode("utf-8")).digest())
+
+def _hash_password(password):
+    return bcrypt.hashpw(str(password).encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+def _verify_password(password, stored):
+    """
+    Returns (matches, is_legacy). Rows created before hashing store plaintext;
+    those are compared in constant time and flagged so the caller can upgrade them.
+    """
+    if not stored:
+        return False, False
+    if stored.startswith("$2"):
+        try:
+            return bcrypt.checkpw(str(password).encode("utf-8"), stored.encode("utf-8")), False
+        except ValueError:
+            return False, False
+    return hmac.compare_digest(str(password).encode("utf-8"), stored.encode("utf-8")), True
+
+@st.cache_resource
+def _admin_creds():
+    # Secrets are fixed for the life of the process; read them once.
+    return st.secrets["admin"]["username"], st.secrets["admin"]["password"]
+
+@st.cache_resource
+def _token_secret():
+    """Key for "stay signed in" tokens, from .streamlit/secrets.toml:
+
+        [auth]
+        token_secret = "<long random string>"
+
+    Without it login tokens are neither issued nor accepted, and every page
+    reload asks for the password again.
+    """
+    secret = st.secrets.get("auth", {}).get("token_secret")
+    if not secret:
+        logger.warning("[auth] token_secret is not set; stay-signed-in tokens are disabled")
+        return None
+    return secret.encode("utf-8")
+
+def login_tokens_enabled():
+    return _token_secret() is not None
+
+# Signed "remember me" tokens: "<user_id>.<expiry>.<hmac-sha256>". The HMAC also
+# covers a fingerprint of the stored password hash, so changing or resetting the
+# password revokes every outstanding token for that user.
+_LOGIN_TOKEN_TTL = 7 * 24 * 3600
+
+def _sign_token(uid, expires, stored_password):
+    fingerprint = hashlib.sha256(str(stored_password).encode("utf-8")).hexdigest()
+    payload = f"{uid}.{expires}.{fingerprint}"
+    return hmac.new(_token_secret(), payload.encode("utf-8"), hashlib.sha256).hexdigest()
+
+def issue_login_token(user_id):
+    if not _token_secret():
+        return None
+    with read_connection() as conn:
+        stored = conn.execute(_SELECT_PASSWORD, {"uid": user_id}).scalar()
+    if stored is None:
+        return None
+    uid, expires = int(user_id), int(time.time()) + _LOGIN_TOKEN_TTL
+    return f"{uid}.{expires}.{_sign_token(uid, expires, stored)}"
+
+def user_from_login_token(token):
+    """Session profile for a valid, unexpired login token; None otherwise."""
+    if not _token_secret():
+        return None
+    try:
+        uid, expires, sig = str(token).split(".")
+        uid, expires = int(uid), int(expires)
+    except ValueError:
+        return None
+    if expires < time.time():
+        return None
+    with read_connection() as conn:
+        stored = conn.execute(_SELECT_PASSWORD, {"uid": uid}).scalar()
+        if stored is None:
+            return None
+        if not hmac.compare_digest(sig.encode("utf-8"), _sign_token(uid, expires, stored).encode("utf-8")):
+            return None
+        return _fetch_profile(conn, uid, active_only=True)
+
+def invalidate_user(user_id):
+    """Drops cached logins for a user so the next authenticate_user hits the DB."""
+    with _AUTH_CACHE_LOCK:
+        for key, cached in list(_AUTH_CACHE.items()):
+            if cached.get("user_id") == user_id:
+                _AUTH_CACHE.pop(key, None)
+
+# Admin-side user writes in logic evict cached logins through this hook
+logic.register_user_change_hook(invalidate_user)
 
 def register_user(user_name, password, mail_id, phone_number):
     try:
-        user_id = get_next_user_id()
         engine = get_engine()
         with engine.begin() as conn:
-            conn.execute(
-                text("""
-                INSERT INTO customer_details (user_id, user_name, password, mail_id, phone_number, is_active, role)
-                VALUES (:user_id, :user_name, :password, :mail_id, :phone_number, :is_active, :role)
-                """),
+            user_id = conn.execute(
+                _INSERT_USER,
                 {
-                    "user_id": user_id,
                     "user_name": user_name,
-                    "password": password,
+                    "password": _hash_password(password),
                     "mail_id": mail_id,
                     "phone_number": phone_number,
                     "is_active": False,
                     "role": "Standard User"
                 },
-            )
+            ).scalar()
+        if user_id is None:
+            return False, "Username already exists"
+        logic.invalidate_users_cache()
         return True, user_id
     except Exception as e:
         return False, str(e)
 
+def _upgrade_legacy_password(user_id, password, old_value):
+    # Best effort: if this fails the row stays plaintext and is retried on the next login
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(_UPGRADE_PASSWORD, {"pw": _hash_password(password), "uid": user_id, "old": old_value})
+
+def _fetch_profile(conn, user_id, active_only=False):
+    profile = conn.execute(_SELECT_PROFILE, {"uid": user_id}).fetchone()
+    if not profile or (active_only and not profile.is_active):
+        return None
+    return {
+        "user_id": profile.user_id,
+        "user_name": profile.user_name,
+        "mail_id": profile.mail_id,
+        "phone_number": profile.phone_number,
+        "is_admin": profile.role == "Admin", # Or check specific role string
+        "role": profile.role,
+        "assigned_stock_type": profile.assigned_stock_type or "parts_stock", # Default to parts_stock
+        "require_password_change": profile.require_password_change,
+        "price_adjustment_percent": profile.price_adjustment_percent
+    }
+
 def authenticate_user(user_name, password):
-    # Check for Admin hardcoded credentials first
-    admin_user = st.secrets["admin"]["username"]
-    admin_pass = st.secrets["admin"]["password"]
+    # Check for Admin hardcoded credentials first; this path must not touch the DB
+    admin_user, admin_pass = _admin_creds()
     
-    if user_name == admin_user and password == admin_pass:
+    user_ok = hmac.compare_digest(str(user_name).encode("utf-8"), str(admin_user).encode("utf-8"))
+    pass_ok = hmac.compare_digest(str(password).encode("utf-8"), str(admin_pass).encode("utf-8"))
+    if user_ok and pass_ok:
         return {
             "user_id": 0,
             "user_name": "Admin",
@@ -40,32 +209,39 @@ def authenticate_user(user_name, password):
             "is_admin": True
         }
 
-    engine = get_engine()
-    with engine.begin() as conn:
-        row = conn.execute(
-            text("""
-            SELECT user_id, user_name, mail_id, phone_number, password, is_active, role, assigned_stock_type, require_password_change, price_adjustment_percent
-            FROM customer_details
-            WHERE user_name = :user_name
-            """),
-            {"user_name": user_name},
-        ).fetchone()
-
-    if row and password == row.password:
-        if not row.is_active:
-             return {"error": "Account pending approval"}
-             
-        return {
-            "user_id": row.user_id,
-            "user_name": row.user_name,
-            "mail_id": row.mail_id,
-            "phone_number": row.phone_number,
-            "is_admin": row.role == "Admin", # Or check specific role string
-            "role": row.role,
-            "assigned_stock_type": row.assigned_stock_type or "parts_stock", # Default to parts_stock
-            "require_password_change": row.require_password_change,
-            "price_adjustment_percent": float(row.price_adjustment_percent or 0)
-        }
+    cache_key = _auth_cache_key(user_name, password)
+    with _AUTH_CACHE_LOCK:
+        cached = _AUTH_CACHE.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    # Fast path: only what is needed to verify the login
+    with read_connection() as conn:
+        row = conn.execute(_VERIFY_LOGIN, {"user_name": user_name}).fetchone()
+
+    if not row:
+        return None
+
+    matches, is_legacy = _verify_password(password, row.password)
+    if not matches:
+        return None
+
+    if is_legacy:
+        # Upgrade plaintext password to a hash off the request thread; hashing is
+        # deliberately slow and the login result does not depend on it
+        upgrade = _BACKGROUND.submit(_upgrade_legacy_password, row.user_id, password, row.password)
+        upgrade.add_done_callback(_log_background_failure)
+
+    if not row.is_active:
+        return {"error": "Account pending approval"}
+
+    # Slow path: full profile only for verified, active users
+    with read_connection() as conn:
+        result = _fetch_profile(conn, row.user_id)
+    if result is not None:
+        with _AUTH_CACHE_LOCK:
+            _AUTH_CACHE[cache_key] = result
+        return dict(result)
     return None
 
 def update_profile(user_id, mail_id, phone_number):
@@ -73,35 +249,37 @@ def update_profile(user_id, mail_id, phone_number):
         engine = get_engine()
         with engine.begin() as conn:
             conn.execute(
-                text("""
-                UPDATE customer_details
-                SET mail_id = :mail_id,
-                    phone_number = :phone_number
-                WHERE user_id = :user_id
-                """),
+                _UPDATE_PROFILE,
                 {"mail_id": mail_id, "phone_number": phone_number, "user_id": user_id},
             )
+        logic.invalidate_users_cache([user_id])
         return True, "Profile updated"
     except Exception as e:
         return False, str(e)
 
 def change_password(user_id, current_password, new_password):
     try:
+        # Hashes are salted, so the current password is checked in Python; both
+        # bcrypt calls run before the write transaction opens
+        with read_connection() as conn:
+            stored = conn.execute(_SELECT_PASSWORD, {"uid": user_id}).scalar()
+
+        matches, _ = _verify_password(current_password, stored)
+        if not matches:
+            return False, "Incorrect current password"
+        new_hash = _hash_password(new_password)
+
         engine = get_engine()
-        # Verify current first
         with engine.begin() as conn:
+            # Guard on the hash we verified so a concurrent change is not overwritten
             row = conn.execute(
-                text("SELECT password FROM customer_details WHERE user_id = :uid"),
-                {"uid": user_id}
+                _CHANGE_PASSWORD,
+                {"pw": new_hash, "uid": user_id, "cur": stored}
             ).fetchone()
-            
-            if not row or row.password != current_password:
-                return False, "Incorrect current password"
-            
-            conn.execute(
-                text("UPDATE customer_details SET password = :pw, require_password_change = FALSE WHERE user_id = :uid"),
-                {"pw": new_password, "uid": user_id}
-            )
+
+        if row is None:
+            return False, "Incorrect current password"
+        invalidate_user(user_id)
         return True, "Password changed successfully"
     except Exception as e:
         return False, str(e)
@@ -111,9 +289,10 @@ def reset_password_admin(user_id, temp_password):
         engine = get_engine()
         with engine.begin() as conn:
             conn.execute(
-                text("UPDATE customer_details SET password = :pw, require_password_change = TRUE WHERE user_id = :uid"),
-                {"pw": temp_password, "uid": user_id}
+                _RESET_PASSWORD,
+                {"pw": _hash_password(temp_password), "uid": user_id}
             )
+        invalidate_user(user_id)
         return True, "Password reset (User must change on next login)"
     except Exception as e:
         return False, str(e)
@@ -5,145 +5,422 @@ from sqlalchemy.engine import Engine
 @st.cache_resource
 def get_engine() -> Engine:
     try:
-        return create_engine(st.secrets["database"]["url"])
+        # pre_ping discards connections the server closed while idle;
+        # recycle stays under typical managed-Postgres idle timeouts.
+        # executemany calls are sent as multi-row VALUES (INSERT) or execute_batch pages (UPDATE/DELETE).
+        return create_engine(
+            st.secrets["database"]["url"],
+            pool_size=10,
+            max_overflow=20,
+            pool_timeout=30,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            executemany_mode="values_plus_batch",
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500,
+        )
     except Exception as e:
         st.error(f"Failed to connect to database: {e}")
         raise e
 
-def init_db():
+def read_connection():
+    """
+    Autocommit connection for read-only queries: skips the BEGIN/ROLLBACK
+    round trips that engine.begin()/connect() wrap around every SELECT.
+    """
+    return get_engine().connect().execution_options(isolation_level="AUTOCOMMIT")
+
+# Base schema, sent as one script so a fresh migration costs a single round trip.
+# Any failure aborts the whole transaction, so every statement must be idempotent.
+_BASE_SCHEMA_SQL = """
+-- Customer Details
+CREATE TABLE IF NOT EXISTS customer_details (
+    user_id INTEGER PRIMARY KEY,
+    user_name TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    mail_id TEXT,
+    phone_number TEXT,
+    is_active BOOLEAN DEFAULT FALSE,
+    role TEXT DEFAULT 'Standard User',
+    assigned_stock_type TEXT DEFAULT 'parts_stock',
+    require_password_change BOOLEAN DEFAULT FALSE,
+    price_adjustment_percent NUMERIC DEFAULT 0
+);
+
+-- User ID Sequence (replaces SELECT MAX(user_id) on every registration)
+-- setval keeps the sequence ahead of IDs created before it existed.
+CREATE SEQUENCE IF NOT EXISTS customer_user_id_seq START 1001;
+SELECT setval('customer_user_id_seq', newest.user_id)
+FROM (SELECT user_id FROM customer_details ORDER BY user_id DESC LIMIT 1) newest
+WHERE newest.user_id >= (SELECT last_value FROM customer_user_id_seq);
+
+-- Parts Stock
+-- No PRIMARY KEY on part_number, to allow:
+-- 1. Same part in different stock types (parts_stock vs HBD_stock)
+-- 2. Soft deletes (multiple versions of same part, only one active)
+CREATE TABLE IF NOT EXISTS parts_stock (
+    id SERIAL PRIMARY KEY,
+    part_number TEXT,
+    description TEXT,
+    free_stock INTEGER,
+    price NUMERIC,
+    stock_type TEXT DEFAULT 'parts_stock',
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    superseded TEXT
+);
+
+-- Order Header
+CREATE TABLE IF NOT EXISTS orders (
+    order_id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    total_price NUMERIC,
+    order_status TEXT DEFAULT 'Pending',
+    stock_type TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Order Details (Line Items)
+-- Note: description and price here ACT as the snapshot.
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER REFERENCES orders(order_id),
+    part_number TEXT,
+    description TEXT,
+    qty INTEGER,
+    requested_qty INTEGER,
+    available_qty INTEGER,
+    price NUMERIC,
+    no_record_flag BOOLEAN DEFAULT FALSE,
+    supersedes TEXT
+);
+
+-- Cart (Persistence)
+CREATE TABLE IF NOT EXISTS cart (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    part_number TEXT,
+    description TEXT,
+    qty INTEGER,
+    price NUMERIC,
+    supersedes TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Columns added after the first release. Tables created by _BASE_SCHEMA_SQL
+# already have them; older tables get only the ones they are missing.
+_LEGACY_ADDED_COLUMNS = {
+    "customer_details": [
+        ("is_active", "BOOLEAN DEFAULT FALSE"),
+        ("role", "TEXT DEFAULT 'Standard User'"),
+        ("assigned_stock_type", "TEXT DEFAULT 'parts_stock'"),
+        ("require_password_change", "BOOLEAN DEFAULT FALSE"),
+        ("price_adjustment_percent", "NUMERIC DEFAULT 0"),
+    ],
+    "parts_stock": [
+        ("stock_type", "TEXT DEFAULT 'parts_stock'"),
+        ("is_active", "BOOLEAN DEFAULT TRUE"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("price", "NUMERIC"),
+        ("superseded", "TEXT"),
+    ],
+    "orders": [("stock_type", "TEXT")],
+    "order_items": [("requested_qty", "INTEGER"), ("supersedes", "TEXT")],
+    "cart": [("supersedes", "TEXT")],
+}
+_LEGACY_DROPPED_COLUMNS = {"cart": ["delivery_area"], "order_items": ["delivery_area"]}
+
+def _legacy_alter_statements(existing):
+    """
+    Builds one ALTER TABLE per table that actually needs changes, given the
+    set of (table, column) pairs already present.
+    """
+    statements = []
+    for table in _LEGACY_ADDED_COLUMNS:
+        actions = [
+            f"ADD COLUMN {col} {ddl}"
+            for col, ddl in _LEGACY_ADDED_COLUMNS.get(table, [])
+            if (table, col) not in existing
+        ]
+        actions += [
+            f"DROP COLUMN {col}"
+            for col in _LEGACY_DROPPED_COLUMNS.get(table, [])
+            if (table, col) in existing
+        ]
+        if actions:
+            statements.append(f"ALTER TABLE {table} " + ", ".join(actions))
+
+    # Legacy parts_stock tables were keyed on part_number: drop that PK
+    # (parts_stock_pkey) before adding the SERIAL id that replaces it.
+    if ("parts_stock", "id") not in existing:
+        statements.append("ALTER TABLE parts_stock DROP CONSTRAINT IF EXISTS parts_stock_pkey")
+        statements.append("ALTER TABLE parts_stock ADD COLUMN id SERIAL PRIMARY KEY")
+    return statements
+
+def _migration_001_base_schema(conn):
+    conn.exec_driver_sql(_BASE_SCHEMA_SQL)
+
+    # One catalog read decides which legacy ALTERs are needed (none on a fresh DB)
+    existing = {
+        (r.table_name, r.column_name)
+        for r in conn.execute(text("""
+        SELECT table_name, column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name IN ('customer_details', 'parts_stock', 'orders', 'order_items', 'cart')
+        """))
+    }
+    statements = _legacy_alter_statements(existing)
+    if statements:
+        conn.exec_driver_sql(";\n".join(statements))
+
+# Lookup indexes for the per-user and per-order access paths
+_LOOKUP_INDEXES_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id);
+CREATE INDEX IF NOT EXISTS idx_cart_user_id ON cart(user_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_parts_stock_part_number_active ON parts_stock(part_number, stock_type) WHERE is_active;
+"""
+
+def _migration_002_lookup_indexes(conn):
+    conn.exec_driver_sql(_LOOKUP_INDEXES_SQL)
+
+# Trigram indexes let the parts search's ILIKE '%...%' filters use an index.
+# pg_trgm needs CREATE privilege on the database; without it search keeps working
+# on sequential scans instead of failing the migration.
+_SEARCH_TRGM_SQL = """
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm not available; parts search will not be indexed';
+END $$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_parts_stock_pn_trgm
+            ON parts_stock USING gin (part_number gin_trgm_ops) WHERE is_active;
+        CREATE INDEX IF NOT EXISTS idx_parts_stock_desc_trgm
+            ON parts_stock USING gin (description gin_trgm_ops) WHERE is_active;
+        CREATE INDEX IF NOT EXISTS idx_parts_stock_superseded_trgm
+            ON parts_stock USING gin (superseded gin_trgm_ops) WHERE is_active;
+    END IF;
+END $$;
+"""
+
+def _migration_003_search_trgm(conn):
+    conn.exec_driver_sql(_SEARCH_TRGM_SQL)
+
+# One cart line per (user, part) so add-to-cart can be a single ON CONFLICT upsert.
+# Existing duplicates are merged into their oldest row first.
+_CART_UNIQUE_SQL = """
+WITH merged AS (
+    SELECT user_id, part_number, MIN(id) AS keep_id, SUM(qty) AS total_qty
+    FROM cart
+    WHERE user_id IS NOT NULL AND part_number IS NOT NULL
+    GROUP BY user_id, part_number
+    HAVING COUNT(*) > 1
+),
+kept AS (
+    UPDATE cart c SET qty = m.total_qty FROM merged m WHERE c.id = m.keep_id
+)
+DELETE FROM cart c
+USING merged m
+WHERE c.user_id = m.user_id AND c.part_number = m.part_number AND c.id <> m.keep_id;
+
+ALTER TABLE cart ADD CONSTRAINT cart_user_part_key UNIQUE (user_id, part_number);
+"""
+
+def _migration_004_cart_unique(conn):
+    conn.exec_driver_sql(_CART_UNIQUE_SQL)
+
+# Backs the admin orders overview, which pages newest-first by timestamp
+_ORDERS_TIMESTAMP_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders(timestamp DESC);
+"""
+
+def _migration_005_orders_timestamp(conn):
+    conn.exec_driver_sql(_ORDERS_TIMESTAMP_INDEX_SQL)
+
+# Backs the stock restore run before an admin clears all orders of one stock type
+_ORDERS_OPEN_STOCK_TYPE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_stock_type_open ON orders(stock_type) WHERE order_status != 'Rejected';
+"""
+
+def _migration_006_orders_open_stock_type(conn):
+    conn.exec_driver_sql(_ORDERS_OPEN_STOCK_TYPE_INDEX_SQL)
+
+# Order history reads a user's orders newest first; the INCLUDE columns make it index-only.
+# It covers every lookup idx_orders_user_id served, so that index is dropped.
+# (Plain CREATE INDEX: migrations run inside a transaction, which rules out CONCURRENTLY.)
+_ORDERS_USER_TIMESTAMP_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_user_timestamp
+    ON orders(user_id, timestamp DESC) INCLUDE (order_id, total_price, order_status);
+DROP INDEX IF EXISTS idx_orders_user_id;
+"""
+
+def _migration_007_orders_user_timestamp(conn):
+    conn.exec_driver_sql(_ORDERS_USER_TIMESTAMP_INDEX_SQL)
+
+# Stock CSV export and upload soft-delete filter active rows by stock type; retired rows stay out of the index
+_PARTS_STOCK_ACTIVE_TYPE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_parts_stock_active_by_type
+    ON parts_stock(stock_type) INCLUDE (part_number, description, free_stock) WHERE is_active;
+"""
+
+def _migration_008_parts_stock_active_by_type(conn):
+    conn.exec_driver_sql(_PARTS_STOCK_ACTIVE_TYPE_INDEX_SQL)
+
+# Admin order purge: restores allocated stock for non-rejected orders, then deletes them with
+# their items. p_stock_type limits it to one stock type; NULL purges everything (the global wipe).
+_ADMIN_PURGE_ORDERS_SQL = """
+CREATE OR REPLACE FUNCTION admin_purge_orders(p_stock_type TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    UPDATE parts_stock ps
+    SET free_stock = ps.free_stock + agg.total
+    FROM (
+        SELECT oi.part_number, o.stock_type, SUM(oi.qty) AS total
+        FROM order_items oi
+        JOIN orders o ON o.order_id = oi.order_id
+        WHERE (p_stock_type IS NULL OR o.stock_type = p_stock_type)
+          AND o.order_status != 'Rejected' AND oi.qty > 0
+        GROUP BY oi.part_number, o.stock_type
+    ) agg
+    WHERE ps.part_number = agg.part_number AND ps.stock_type = agg.stock_type;
+
+    DELETE FROM order_items
+    WHERE p_stock_type IS NULL
+       OR order_id IN (SELECT order_id FROM orders WHERE stock_type = p_stock_type);
+
+    DELETE FROM orders WHERE p_stock_type IS NULL OR stock_type = p_stock_type;
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$;
+"""
+
+def _migration_009_admin_purge_orders(conn):
+    conn.exec_driver_sql(_ADMIN_PURGE_ORDERS_SQL)
+
+# Admin user list reads these columns in user_id order; the INCLUDE list makes it index-only.
+# password is left out so login-time password upgrades stay HOT updates.
+_CUSTOMER_DETAILS_ADMIN_LIST_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_customer_details_admin_list
+    ON customer_details(user_id)
+    INCLUDE (user_name, mail_id, phone_number, is_active, role, assigned_stock_type, price_adjustment_percent);
+"""
+
+def _migration_010_customer_details_admin_list(conn):
+    conn.exec_driver_sql(_CUSTOMER_DETAILS_ADMIN_LIST_INDEX_SQL)
+
+# Each admin orders tab pages newest-first through one stock type; older orders with no
+# stock_type belong to the parts tab, hence the COALESCE expression.
+_ORDERS_STOCK_TYPE_TIMESTAMP_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_stock_type_timestamp
+    ON orders((COALESCE(stock_type, 'parts_stock')), timestamp DESC, order_id DESC);
+"""
+
+def _migration_011_orders_stock_type_timestamp(conn):
+    conn.exec_driver_sql(_ORDERS_STOCK_TYPE_TIMESTAMP_INDEX_SQL)
+
+# admin_purge_orders again, crediting stock back only to active rows: orders only debit
+# active rows, so retired stock versions must not receive returned quantities.
+_ADMIN_PURGE_ORDERS_ACTIVE_ONLY_SQL = """
+CREATE OR REPLACE FUNCTION admin_purge_orders(p_stock_type TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    purged INTEGER;
+BEGIN
+    UPDATE parts_stock ps
+    SET free_stock = ps.free_stock + agg.total
+    FROM (
+        SELECT oi.part_number, o.stock_type, SUM(oi.qty) AS total
+        FROM order_items oi
+        JOIN orders o ON o.order_id = oi.order_id
+        WHERE (p_stock_type IS NULL OR o.stock_type = p_stock_type)
+          AND o.order_status != 'Rejected' AND oi.qty > 0
+        GROUP BY oi.part_number, o.stock_type
+    ) agg
+    WHERE ps.part_number = agg.part_number AND ps.stock_type = agg.stock_type
+      AND ps.is_active;
+
+    DELETE FROM order_items
+    WHERE p_stock_type IS NULL
+       OR order_id IN (SELECT order_id FROM orders WHERE stock_type = p_stock_type);
+
+    DELETE FROM orders WHERE p_stock_type IS NULL OR stock_type = p_stock_type;
+    GET DIAGNOSTICS purged = ROW_COUNT;
+    RETURN purged;
+END;
+$$;
+"""
+
+def _migration_012_admin_purge_orders_active_only(conn):
+    conn.exec_driver_sql(_ADMIN_PURGE_ORDERS_ACTIVE_ONLY_SQL)
+
+# Bulk enquiry matches part numbers with dashes and padding stripped; the expression here
+# must stay identical to the one in logic._SQL_BULK_STOCK for the planner to use it.
+_PARTS_STOCK_NORMALIZED_PN_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_parts_stock_normalized_pn_active
+    ON parts_stock((TRIM(REPLACE(part_number, '-', ''))), stock_type) WHERE is_active;
+"""
+
+def _migration_013_parts_stock_normalized_pn(conn):
+    conn.exec_driver_sql(_PARTS_STOCK_NORMALIZED_PN_INDEX_SQL)
+
+# Ordered (version, migration) pairs. Append new entries; never edit applied ones.
+MIGRATIONS = [
+    (1, _migration_001_base_schema),
+    (2, _migration_002_lookup_indexes),
+    (3, _migration_003_search_trgm),
+    (4, _migration_004_cart_unique),
+    (5, _migration_005_orders_timestamp),
+    (6, _migration_006_orders_open_stock_type),
+    (7, _migration_007_orders_user_timestamp),
+    (8, _migration_008_parts_stock_active_by_type),
+    (9, _migration_009_admin_purge_orders),
+    (10, _migration_010_customer_details_admin_list),
+    (11, _migration_011_orders_stock_type_timestamp),
+    (12, _migration_012_admin_purge_orders_active_only),
+    (13, _migration_013_parts_stock_normalized_pn),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+@st.cache_resource
+def init_db() -> bool:
+    # Cached: main.py calls this on every rerun, but it only needs to run once per process
     engine = get_engine()
     with engine.begin() as conn:
-        # Customer Details
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS customer_details (
-            user_id INTEGER PRIMARY KEY,
-            user_name TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            mail_id TEXT,
-            phone_number TEXT,
-            is_active BOOLEAN DEFAULT FALSE,
-            role TEXT DEFAULT 'Standard User',
-            assigned_stock_type TEXT DEFAULT 'parts_stock',
-            require_password_change BOOLEAN DEFAULT FALSE
-        );
-        """))
-        
-        # Soft Migration: Add columns if they don't exist
-        try:
-            conn.execute(text("ALTER TABLE customer_details ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT FALSE"))
-            conn.execute(text("ALTER TABLE customer_details ADD COLUMN IF NOT EXISTS role TEXT DEFAULT 'Standard User'"))
-            conn.execute(text("ALTER TABLE customer_details ADD COLUMN IF NOT EXISTS assigned_stock_type TEXT DEFAULT 'parts_stock'"))
-            conn.execute(text("ALTER TABLE customer_details ADD COLUMN IF NOT EXISTS require_password_change BOOLEAN DEFAULT FALSE"))
-            conn.execute(text("ALTER TABLE customer_details ADD COLUMN IF NOT EXISTS price_adjustment_percent NUMERIC DEFAULT 0"))
-        except Exception as e:
-            pass
-        
-        # Parts Stock
-        # Note: We are removing the PRIMARY KEY on part_number to allow:
-        # 1. Same part in different stock types (parts_stock vs HBD_stock)
-        # 2. Soft deletes (multiple versions of same part, only one active)
-        # We will use a composite index or just rely on logic for uniqueness of active items.
-        
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS parts_stock (
-            id SERIAL PRIMARY KEY,
-            part_number TEXT,
-            description TEXT,
-            free_stock INTEGER,
-            price NUMERIC,
-            stock_type TEXT DEFAULT 'parts_stock',
-            is_active BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """))
-        
-        # Migration for parts_stock is trickier if table exists with PK on part_number.
-        # SQLite vs Postgres differences matter here. User seems to be using Postgres (SERIAL).
-        # We will attempt to add columns.
-        try:
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS stock_type TEXT DEFAULT 'parts_stock'"))
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT TRUE"))
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP"))
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS price NUMERIC"))
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS superseded TEXT"))
-            # Ideally we drop PK constraint on part_number if it exists, but that's hard to do generically without knowing constraint name.
-            # For now, we assume if it fails, user might need to drop table or we handle it.
-            # Let's try to drop the constraint if we can guess the name or if it's just 'parts_stock_pkey'
-            conn.execute(text("ALTER TABLE parts_stock DROP CONSTRAINT IF EXISTS parts_stock_pkey"))
-            # If we dropped PK, we should add a new ID column if it doesn't exist? 
-            # Adding SERIAL column to existing table is possible.
-            conn.execute(text("ALTER TABLE parts_stock ADD COLUMN IF NOT EXISTS id SERIAL PRIMARY KEY"))
-        except Exception as e:
-            # If validation fails (e.g. multiple primary keys), we might need manual intervention or just proceed.
-            # print(f"Migration warning: {e}")
-            pass
-        
-        # Order Header
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS orders (
-            order_id SERIAL PRIMARY KEY,
-            user_id INTEGER,
-            total_price NUMERIC,
-            order_status TEXT DEFAULT 'Pending',
-            stock_type TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """))
-        
-        try:
-            conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS stock_type TEXT"))
-        except Exception:
-            pass
-
-        # Order Details (Line Items)
-        # Note: description and price here ACT as the snapshot.
-        conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS order_items (
-            id SERIAL PRIMARY KEY,
-            order_id INTEGER REFERENCES orders(order_id),
-            part_number TEXT,
-            description TEXT,
-            qty INTEGER,
-            requested_qty INTEGER,
-            available_qty INTEGER,
-            price NUMERIC,
-            no_record_flag BOOLEAN DEFAULT FALSE,
-            supersedes TEXT
-        );
-        """))
-        
-        # Soft Migration
-        try:
-             conn.execute(text("ALTER TABLE order_items ADD COLUMN IF NOT EXISTS requested_qty INTEGER"))
-             conn.execute(text("ALTER TABLE order_items ADD COLUMN IF NOT EXISTS supersedes TEXT"))
-        except Exception:
-             pass
-        
-        # Cart (Persistence)
+        # Fast path: nothing to do once the recorded version is current
+        if conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar() is not None:
+            current = conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+            if current >= SCHEMA_VERSION:
+                return True
+
+        # Serialize concurrent workers; re-read the version once we hold the lock
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))"))
         conn.execute(text("""
-        CREATE TABLE IF NOT EXISTS cart (
-            id SERIAL PRIMARY KEY,
-            user_id INTEGER,
-            part_number TEXT,
-            description TEXT,
-            qty INTEGER,
-            price NUMERIC,
-            supersedes TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """))
-        
-        # Cleanup Legacy Columns
-        try:
-            conn.execute(text("ALTER TABLE cart DROP COLUMN IF EXISTS delivery_area"))
-            conn.execute(text("ALTER TABLE order_items DROP COLUMN IF EXISTS delivery_area"))
-            conn.execute(text("ALTER TABLE cart ADD COLUMN IF NOT EXISTS supersedes TEXT"))
-        except Exception:
-            pass
-
-def get_next_user_id():
-    engine = get_engine()
-    with engine.begin() as conn:
-        result = conn.execute(text("SELECT MAX(user_id) FROM customer_details"))
-        max_id = result.scalar()
-        return 1001 if max_id is None else max_id + 1
+        current = conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+        for version, migrate in MIGRATIONS:
+            if version > current:
+                migrate(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version) VALUES (:v)"),
+                    {"v": version}
+                )
+    return True
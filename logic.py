@@ -1,9 +1,230 @@
+import io
+import threading
+import numpy as np
 import pandas as pd
+import streamlit as st
+from cachetools import TTLCache
 from sqlalchemy import text
 from datetime import datetime
-from database import get_engine
+from types import MappingProxyType
+from database import get_engine, read_connection
+
+# ---------- SQL ----------
+# Statements are built once at import so SQLAlchemy reuses their compiled form
+_SQL_DEACTIVATE_STOCK = text("UPDATE parts_stock SET is_active = FALSE WHERE stock_type = :st AND is_active = TRUE")
+_SQL_DELETE_STOCK = text("DELETE FROM parts_stock WHERE stock_type = :st")
+_SQL_SEARCH_PARTS = text("""
+SELECT part_number, description, free_stock,
+       price, stock_type, superseded
+FROM parts_stock
+WHERE (part_number ILIKE :prefix OR part_number ILIKE :raw_prefix OR description ILIKE :prefix OR superseded ILIKE :prefix)
+  AND stock_type = :st
+  AND is_active = TRUE
+ORDER BY 
+    CASE 
+        WHEN part_number ILIKE :exact_start THEN 1 
+        ELSE 2 
+    END, 
+    part_number
+LIMIT 50
+""")
+_SQL_SUPERSESSION_CHAINS = text("""
+WITH RECURSIVE chain AS (
+    SELECT part_number, description, free_stock, price, stock_type, superseded, 0 AS depth
+    FROM parts_stock
+    WHERE part_number = ANY(:roots) AND stock_type = :st AND is_active = TRUE
+    UNION ALL
+    SELECT p.part_number, p.description, p.free_stock, p.price, p.stock_type, p.superseded, chain.depth + 1
+    FROM parts_stock p
+    JOIN chain ON p.part_number = TRIM(chain.superseded)
+    WHERE p.stock_type = :st AND p.is_active = TRUE AND chain.depth < 5
+)
+SELECT DISTINCT part_number, description, free_stock, price, stock_type, superseded
+FROM chain
+""")
+_SQL_PART_BY_NUMBER = text("""
+SELECT part_number, description, free_stock, price
+FROM parts_stock
+WHERE part_number = :part_number 
+  AND stock_type = :st
+  AND is_active = TRUE
+""")
+_SQL_UPDATE_CART_QTY = text("UPDATE cart SET qty = :qty WHERE id = :id")
+_SQL_UPSERT_CART_ITEM = text("""
+INSERT INTO cart (user_id, part_number, description, qty, price, supersedes)
+VALUES (:user_id, :part_number, :description, :qty, :price, :supersedes)
+ON CONFLICT (user_id, part_number) DO UPDATE SET qty = cart.qty + EXCLUDED.qty
+""")
+_SQL_USER_CART = text("""
+SELECT c.id, c.part_number, c.supersedes, c.description, c.qty, c.price,
+       p.free_stock as available_qty,
+       -- Logic: Allocated = min(Req, Stock)
+       CASE WHEN a.avail >= c.qty THEN c.qty WHEN a.avail > 0 THEN a.avail ELSE 0 END AS allocated_qty,
+       CASE
+           WHEN a.avail >= c.qty THEN 'Fully Allocated'
+           WHEN a.avail > 0 THEN 'Partial Fulfillment'
+           ELSE 'Out of Stock'
+       END AS status,
+       FALSE AS no_record, -- existed in cart means valid
+       -- Back Order calculation: Requested Qty - Current Stock, otherwise 0
+       GREATEST(0, c.qty - a.avail) AS back_order
+FROM cart c
+LEFT JOIN parts_stock p ON c.part_number = p.part_number AND p.stock_type = :st AND p.is_active = TRUE
+CROSS JOIN LATERAL (SELECT COALESCE(p.free_stock, 0) AS avail) a
+WHERE c.user_id = :user_id
+ORDER BY c.timestamp DESC
+""")
+_SQL_DELETE_CART_ITEM = text("DELETE FROM cart WHERE id = :id")
+_SQL_CLEAR_CART = text("DELETE FROM cart WHERE user_id = :user_id")
+_SQL_BULK_UPDATE_CART_QTY = text("""
+UPDATE cart c SET qty = v.qty
+FROM unnest(CAST(:ids AS INTEGER[]), CAST(:qtys AS INTEGER[])) AS v(id, qty)
+WHERE c.id = v.id
+""")
+_SQL_BULK_DELETE_CART = text("DELETE FROM cart WHERE id = ANY(:ids)")
+_SQL_INSERT_ORDER_HEADER = text("INSERT INTO orders (user_id, total_price, stock_type) VALUES (:uid, 0, :stype) RETURNING order_id")
+_SQL_PLACE_ORDER_ITEMS = text("""
+WITH input AS (
+    SELECT * FROM unnest(
+        CAST(:line_nos AS integer[]), CAST(:pns AS text[]), CAST(:descs AS text[]),
+        CAST(:reqs AS integer[]), CAST(:prices AS numeric[]), CAST(:sups AS text[])
+    ) AS t(line_no, pn, description, req, price, supersedes)
+),
+stock AS (
+    -- Lock the stock rows so concurrent orders allocate against current values
+    SELECT part_number, MAX(free_stock) AS free_stock
+    FROM (
+        SELECT part_number, free_stock FROM parts_stock
+        WHERE stock_type = :stype AND is_active = TRUE
+          AND part_number IN (SELECT pn FROM input)
+        FOR UPDATE
+    ) locked
+    GROUP BY part_number
+),
+alloc AS (
+    SELECT line_no, pn, description, req, price, supersedes,
+           LEAST(req, avail) AS qty, avail
+    FROM (
+        SELECT i.*,
+               GREATEST(COALESCE(s.free_stock, 0)
+                        - (SUM(i.req) OVER (PARTITION BY i.pn ORDER BY i.line_no) - i.req), 0) AS avail
+        FROM input i
+        LEFT JOIN stock s ON s.part_number = i.pn
+    ) running
+),
+deduct AS (
+    UPDATE parts_stock p
+    SET free_stock = p.free_stock - d.total
+    FROM (SELECT pn, SUM(qty) AS total FROM alloc GROUP BY pn HAVING SUM(qty) > 0) d
+    WHERE p.part_number = d.pn AND p.stock_type = :stype AND p.is_active = TRUE
+),
+inserted AS (
+    INSERT INTO order_items
+    (order_id, part_number, description, qty, requested_qty, available_qty, price, supersedes)
+    SELECT :oid, pn, description, qty, req, avail, price, supersedes
+    FROM alloc
+    ORDER BY line_no
+    RETURNING qty, price
+)
+UPDATE orders
+SET total_price = (SELECT COALESCE(SUM(qty * price), 0) FROM inserted)
+WHERE order_id = :oid
+""")
+_SQL_BULK_STOCK = text("""
+SELECT part_number, description, free_stock, price::float8 AS price, superseded
+FROM parts_stock
+WHERE stock_type = :st AND is_active = TRUE
+  AND TRIM(REPLACE(part_number, '-', '')) = ANY(:keys)
+""")
+_SQL_BULK_SUPERSEDED_STOCK = text("""
+SELECT part_number, description, free_stock, price::float8 AS price, superseded
+FROM parts_stock
+WHERE stock_type = :st AND is_active = TRUE
+  AND (part_number = ANY(:sup) OR TRIM(REPLACE(part_number, '-', '')) = ANY(:sup_norm))
+  AND NOT (TRIM(REPLACE(part_number, '-', '')) = ANY(:keys))
+""")
+_SQL_RESTORE_ORDER_STOCK = text("""
+UPDATE parts_stock ps
+SET free_stock = ps.free_stock + agg.total
+FROM (
+    SELECT oi.part_number, o.stock_type, SUM(oi.qty) AS total
+    FROM order_items oi
+    JOIN orders o ON o.order_id = oi.order_id
+    WHERE oi.order_id = :oid AND oi.qty > 0
+    GROUP BY oi.part_number, o.stock_type
+) agg
+WHERE ps.part_number = agg.part_number AND ps.stock_type = agg.stock_type
+  AND ps.is_active -- the rows _SQL_PLACE_ORDER_ITEMS debited
+""")
+# Restore stock for non-rejected orders, then delete the orders and their items, server-side
+# (admin_purge_orders is created by migration 9, replaced by 12; a NULL stock type purges every order)
+_SQL_PURGE_ORDERS = text("SELECT admin_purge_orders(CAST(:st AS TEXT))")
+_SQL_DELETE_ORDER = text("""
+WITH deleted_order AS (
+    DELETE FROM orders WHERE order_id = :oid RETURNING order_id
+)
+DELETE FROM order_items WHERE order_id = :oid
+""")
+_SQL_ALL_ORDERS_PAGE = text("""
+SELECT order_id, user_id, total_price, order_status, stock_type, timestamp
+FROM orders
+WHERE (CAST(:before_ts AS TIMESTAMP) IS NULL OR (timestamp, order_id) < (CAST(:before_ts AS TIMESTAMP), CAST(:before_id AS INTEGER)))
+  AND (CAST(:st AS TEXT) IS NULL OR COALESCE(stock_type, 'parts_stock') = :st)
+ORDER BY timestamp DESC, order_id DESC
+LIMIT :limit
+""")
+_SQL_ORDER_DETAILS = text("SELECT id, order_id, part_number, description, qty, requested_qty, available_qty, price, no_record_flag, supersedes FROM order_items WHERE order_id = :oid")
+_SQL_ORDER_DETAILS_BULK = text("SELECT id, order_id, part_number, description, qty, requested_qty, available_qty, price, no_record_flag, supersedes FROM order_items WHERE order_id = ANY(:oids) ORDER BY order_id, id")
+_SQL_UPDATE_ORDER_STATUS = text("""
+UPDATE orders o SET order_status = :status
+FROM (SELECT order_id, order_status FROM orders WHERE order_id = :oid FOR UPDATE) old
+WHERE o.order_id = old.order_id
+RETURNING old.order_status
+""")
+_SQL_ALL_USERS = text("SELECT user_id, user_name, mail_id, phone_number, is_active, role, assigned_stock_type, COALESCE(price_adjustment_percent, 0)::float8 AS price_adjustment_percent FROM customer_details ORDER BY user_id")
+# Header totals come from the items: 'orders' only stores the allocated total
+_SQL_USER_ORDERS = text("""
+SELECT o.order_id, o.total_price, o.order_status, o.timestamp,
+       COALESCE(t.req_total, 0) AS req_total,
+       COALESCE(t.alloc_total, 0) AS alloc_total
+FROM orders o
+LEFT JOIN LATERAL (
+    SELECT CAST(SUM(i.price * i.requested_qty) AS FLOAT8) AS req_total,
+           CAST(SUM(i.price * i.qty) AS FLOAT8) AS alloc_total -- qty is allocated
+    FROM order_items i
+    WHERE i.order_id = o.order_id
+) t ON TRUE
+WHERE o.user_id = :uid
+ORDER BY o.timestamp DESC
+""")
+
+# Recent search results keyed by (prefix, stock_type, adjustment_percent); stock writes clear it,
+# the short TTL bounds staleness from admin-side order changes.
+_SEARCH_CACHE = TTLCache(maxsize=1024, ttl=30)
+
+# The admin user roster; user writes clear it, the TTL covers writes made by other processes
+_USERS_CACHE = TTLCache(maxsize=1, ttl=60)
+
+# The caches here are shared by every session thread and TTLCache is not thread-safe;
+# every get/set/clear holds this lock.
+_CACHE_LOCK = threading.Lock()
+
+def clear_search_cache():
+    with _CACHE_LOCK:
+        _SEARCH_CACHE.clear()
 
 # ---------- HELPER ----------
+# sanitize_part_number's removals and O -> 0 substitution as a single translate pass
+_SANITIZE_TRANS = str.maketrans({'*': '', '@': '', '+': '', 'O': '0'})
+
+# Lookup keys for bulk matching: sanitize_part_number's rules plus hyphen removal,
+# applied in one pass per column via Series.str.translate
+_LOOKUP_KEY_TRANS = str.maketrans({'*': '', '@': '', '+': '', 'O': '0', '-': ''})
+
+def sanitize_part_numbers_for_lookup(part_numbers: pd.Series) -> pd.Series:
+    """Vectorized sanitize_part_number(x).replace("-", "") for a whole column."""
+    return part_numbers.fillna("").astype(str).str.upper().str.translate(_LOOKUP_KEY_TRANS).str.strip()
+
 def sanitize_part_number(part_number):
     """
     Sanitizes part number:
@@ -13,45 +234,46 @@ def sanitize_part_number(part_number):
     """
     if not part_number:
         return ""
-        
-    s = str(part_number).upper() # Normalize case
-    
-    # Remove special chars: *, @, +
-    for char in ['*', '@', '+']:
-        s = s.replace(char, '')
-        
-    # Replace O with 0
-    s = s.replace('O', '0')
-    
-    return s.strip()
+
+    # Normalize case, then remove *, @, + and replace O with 0 in one pass
+    return str(part_number).upper().translate(_SANITIZE_TRANS).strip()
 
 # ---------- STOCK MANAGEMENT ----------
 # ---------- STOCK MANAGEMENT ----------
+_STOCK_UPLOAD_COLUMNS = {
+    'part_number': 'part_number',
+    'description': 'description',
+    'stock': 'free_stock',
+    'price($)': 'price'
+}
+
+def stock_upload_target(col):
+    """parts_stock column an uploaded CSV header maps to, or None if upload_parts_stock ignores it."""
+    col = str(col).strip().lower()
+    if col in _STOCK_UPLOAD_COLUMNS:
+        return _STOCK_UPLOAD_COLUMNS[col]
+    if 'supersede' in col: # fuzzy match for superseded
+        return 'superseded'
+    return None
+
 def upload_parts_stock(df_parts: pd.DataFrame, stock_type: str):
-    df = df_parts.copy()
-    df.columns = df.columns.str.strip().str.lower()
+    # rename() hands back a new frame, so the caller's DataFrame is never mutated
+    df = df_parts.rename(columns=lambda c: str(c).strip().lower())
     
-    column_mapping = {
-        'part_number': 'part_number',
-        'description': 'description',
-        'stock': 'free_stock',
-        'price($)': 'price'
-    }
-
     # Rename mapped columns
     actual_map = {}
     for col in df.columns:
-        if col in column_mapping:
-            actual_map[col] = column_mapping[col]
-        elif 'supersede' in col.lower(): # fuzzy match for superseded
-            actual_map[col] = 'superseded'
+        target = stock_upload_target(col)
+        if target:
+            actual_map[col] = target
             
     df = df.rename(columns=actual_map)
     
     # Sanitization: Ensure Price is numeric
     if 'price' in df.columns:
-        # Convert to string, clean, then to numeric
-        df['price'] = df['price'].astype(str).str.replace('$', '').str.replace(',', '').str.strip()
+        # Strip currency symbols, separators and whitespace in one pass, then to numeric
+        if not pd.api.types.is_numeric_dtype(df['price']):
+            df['price'] = df['price'].astype(str).str.replace(r'[\$,\s]', '', regex=True)
         df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0)
 
     
@@ -67,25 +289,66 @@ def upload_parts_stock(df_parts: pd.DataFrame, stock_type: str):
     with engine.begin() as conn:
         # Soft Delete: Mark existing active items of this stock_type as inactive
         conn.execute(
-            text("UPDATE parts_stock SET is_active = FALSE WHERE stock_type = :st AND is_active = TRUE"),
+            _SQL_DEACTIVATE_STOCK,
             {"st": stock_type}
         )
         
         # Insert New
         # Filter to allowed columns. Removed legacy delivery prices.
         allowed_cols = ['part_number', 'description', 'free_stock', 'price', 'stock_type', 'is_active', 'superseded']
-        df_final = df[[c for c in allowed_cols if c in df.columns]]
-        
-        df_final.to_sql("parts_stock", con=conn, if_exists="append", index=False)
+        df_final = df[[c for c in allowed_cols if c in df.columns]].copy()
+        if 'free_stock' in df_final.columns:
+            # COPY parses text, so "5.0" would be rejected by the INTEGER column
+            df_final['free_stock'] = pd.to_numeric(df_final['free_stock'], errors='coerce').round().astype('Int64')
+
+        # Stream the sheet through COPY on the same transaction as the soft delete
+        buf = io.StringIO()
+        df_final.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        copy_sql = f"COPY parts_stock ({', '.join(df_final.columns)}) FROM STDIN WITH (FORMAT csv)"
+        with conn.connection.cursor() as cur:
+            cur.copy_expert(copy_sql, buf)
+    clear_search_cache()
 
 def reset_stock(stock_type: str):
     engine = get_engine()
     with engine.begin() as conn:
         # Hard Delete
         conn.execute(
-            text("DELETE FROM parts_stock WHERE stock_type = :st"),
+            _SQL_DELETE_STOCK,
             {"st": stock_type}
         )
+    clear_search_cache()
+
+def _walk_chain(root, sup_lookup, process_row, max_depth=5):
+    """Follow a part's supersession links through the prefetched lookup.
+
+    Returns the first replacement with the rest of the chain nested under
+    'superseded_part', or None. Parts already seen are skipped, so cycles end.
+    """
+    chain = []
+    current = root
+    while len(chain) <= max_depth:
+        sup = current.get('superseded')
+        # Logic: If superseded exists (Removed stock check: always show if exists)
+        if not sup or not str(sup).strip():
+            break
+        nxt = None
+        for sd in sup_lookup.get(str(sup).strip(), []):
+            # Apply adjustment to superseded part too (copy so the lookup stays untouched)
+            nxt = process_row(sd.copy())
+            if nxt:
+                nxt['is_superseded_replacement'] = True
+                break
+        if not nxt:
+            break
+        chain.append(nxt)
+        current = nxt
+
+    # Link the chain bottom-up: each replacement points at its own replacement
+    for parent, child in zip(chain, chain[1:]):
+        parent['superseded_part'] = child
+    return chain[0] if chain else None
 
 def get_parts_like(prefix, stock_type, adjustment_percent=0):
     # Search Logic: Sanitize Input FIRST
@@ -94,25 +357,26 @@ def get_parts_like(prefix, stock_type, adjustment_percent=0):
     # Still strip hyphens for the DB search logic key (cleaned_prefix)
     # But now we base it on the sanitized input
     cleaned_prefix = sanitized_input.replace("-", "").strip()
+
+    cache_key = (str(prefix).strip(), stock_type, adjustment_percent)
+    with _CACHE_LOCK:
+        results = _SEARCH_CACHE.get(cache_key)
+    if results is None:
+        # Frozen before caching: every session shares these rows, so none can mutate them
+        results = tuple(_freeze(r) for r in _search_parts(prefix, cleaned_prefix, stock_type, adjustment_percent))
+        with _CACHE_LOCK:
+            _SEARCH_CACHE[cache_key] = results
     
-    engine = get_engine()
-    with engine.begin() as conn:
+    return list(results)
+
+def _freeze(d):
+    # Read-only view of a result row, nested superseded parts included
+    return MappingProxyType({k: _freeze(v) if isinstance(v, dict) else v for k, v in d.items()})
+
+def _search_parts(prefix, cleaned_prefix, stock_type, adjustment_percent):
+    with read_connection() as conn:
         rows = conn.execute(
-            text("""
-            SELECT part_number, description, free_stock,
-                   price, stock_type, superseded
-            FROM parts_stock
-            WHERE (part_number ILIKE :prefix OR part_number ILIKE :raw_prefix OR description ILIKE :prefix OR superseded ILIKE :prefix)
-              AND stock_type = :st
-              AND is_active = TRUE
-            ORDER BY 
-                CASE 
-                    WHEN part_number ILIKE :exact_start THEN 1 
-                    ELSE 2 
-                END, 
-                part_number
-            LIMIT 50
-            """),
+            _SQL_SEARCH_PARTS,
             {
                 "prefix": f"%{cleaned_prefix}%",
                 "raw_prefix": f"%{str(prefix).strip()}%",
@@ -120,7 +384,22 @@ def get_parts_like(prefix, stock_type, adjustment_percent=0):
                 "st": stock_type
             },
         ).fetchall()
-        
+
+        # Fetch every supersession chain reachable from these results in one round trip
+        # (depth-limited like the traversal below, so cycles terminate)
+        roots = list({str(r.superseded).strip() for r in rows if r.superseded and str(r.superseded).strip()})
+        chain_rows = []
+        if roots:
+            chain_rows = conn.execute(
+                _SQL_SUPERSESSION_CHAINS,
+                {"roots": roots, "st": stock_type}
+            ).fetchall()
+
+    # part_number -> candidate replacement rows
+    sup_lookup = {}
+    for s_row in chain_rows:
+        sup_lookup.setdefault(s_row.part_number, []).append(dict(s_row._mapping))
+
     results = []
     seen_parts = set()
     
@@ -141,47 +420,8 @@ def get_parts_like(prefix, stock_type, adjustment_percent=0):
         d = dict(row._mapping)
         processed = process_row(d)
         if processed:
-            # Recursive Supersession Check
-            def check_supersession(current_part_data, depth=0):
-                if depth > 5: return None # Prevent infinite loops
-                
-                free_stock = current_part_data.get('free_stock') or 0
-                sup = current_part_data.get('superseded')
-                
-                # Logic: If superseded exists (Removed stock check: always show if exists)
-                if sup and str(sup).strip():
-                    sup_clean = str(sup).strip()
-                    # Query DB for this specific part
-                    with engine.begin() as conn2:
-                        sup_rows = conn2.execute(
-                            text("""
-                            SELECT part_number, description, free_stock, price, stock_type, superseded
-                            FROM parts_stock
-                            WHERE part_number = :pn AND stock_type = :st AND is_active = TRUE
-                            """),
-                            {"pn": sup_clean, "st": stock_type}
-                        ).fetchall()
-                        
-                    for s_row in sup_rows:
-                        sd = dict(s_row._mapping)
-                        
-                        # Apply adjustment to superseded part too
-                        s_processed_inner = process_row(sd.copy()) # Copy to avoid mutating shared cache if any
-                        if s_processed_inner:
-                            # Attach as object to the PARENT
-                            # If this superseded part IS superseded recursively, call again
-                            s_processed_inner['is_superseded_replacement'] = True
-                            
-                            # Recursion
-                            resup = check_supersession(s_processed_inner, depth+1)
-                            if resup:
-                                s_processed_inner['superseded_part'] = resup
-                            
-                            return s_processed_inner
-                return None
-
             # Attach superseded info to the result
-            sup_obj = check_supersession(processed)
+            sup_obj = _walk_chain(processed, sup_lookup, process_row)
             if sup_obj:
                processed['superseded_part'] = sup_obj
                # Also set a flag for UI
@@ -189,28 +429,12 @@ def get_parts_like(prefix, stock_type, adjustment_percent=0):
 
             results.append(processed)
             
-    # Simple object class that supports dot notation and nested objects
-    class PartObj:
-        def __init__(self, **entries):
-            for k, v in entries.items():
-                if isinstance(v, dict):
-                    self.__dict__[k] = PartObj(**v)
-                else:
-                    self.__dict__[k] = v
-            
-    return [PartObj(**r) for r in results]
+    return results
 
 def get_part_by_number(part_number, stock_type):
-    engine = get_engine()
-    with engine.begin() as conn:
+    with read_connection() as conn:
         row = conn.execute(
-            text("""
-            SELECT part_number, description, free_stock, price
-            FROM parts_stock
-            WHERE part_number = :part_number 
-              AND stock_type = :st
-              AND is_active = TRUE
-            """),
+            _SQL_PART_BY_NUMBER,
             {"part_number": part_number, "st": stock_type},
         ).fetchone()
     return row
@@ -222,83 +446,32 @@ def add_to_cart_db(user_id, part_number, description, qty, price, supersedes=Non
     
     engine = get_engine()
     with engine.begin() as conn:
-        # Check if exists
-        curr = conn.execute(
-            text("SELECT id, qty FROM cart WHERE user_id = :uid AND part_number = :pn"),
-            {"uid": user_id, "pn": part_number}
-        ).fetchone()
-        
-        if curr:
-            # UPSERT: Update existing
-            new_qty = curr.qty + qty
-            conn.execute(
-                text("UPDATE cart SET qty = :qty WHERE id = :id"),
-                {"qty": new_qty, "id": curr.id}
-            )
-        else:
-            # Insert New
-            conn.execute(
-                text("""
-                INSERT INTO cart (user_id, part_number, description, qty, price, supersedes)
-                VALUES (:user_id, :part_number, :description, :qty, :price, :supersedes)
-                """),
-                {
-                    "user_id": user_id,
-                    "part_number": part_number,
-                    "description": description,
-                    "qty": qty,
-                    "price": price,
-                    "supersedes": supersedes
-                }
-            )
+        # UPSERT: insert, or add to the qty of the existing line for this part
+        conn.execute(
+            _SQL_UPSERT_CART_ITEM,
+            {
+                "user_id": user_id,
+                "part_number": part_number,
+                "description": description,
+                "qty": qty,
+                "price": price,
+                "supersedes": supersedes
+            }
+        )
 
 def get_user_cart(user_id, stock_type='parts_stock'):
-    engine = get_engine()
-    with engine.begin() as conn:
+    with read_connection() as conn:
         # Join with stock to get real-time availability
-        rows = conn.execute(
-            text("""
-            SELECT c.id, c.part_number, c.supersedes, c.description, c.qty, c.price,
-                   p.free_stock as available_qty
-            FROM cart c
-            LEFT JOIN parts_stock p ON c.part_number = p.part_number AND p.stock_type = :st AND p.is_active = TRUE
-            WHERE c.user_id = :user_id
-            ORDER BY c.timestamp DESC
-            """),
+        return conn.execute(
+            _SQL_USER_CART,
             {"user_id": user_id, "st": stock_type}
-        ).fetchall()
-        
-    results = []
-    for row in rows:
-        d = dict(row._mapping)
-        req = d['qty']
-        avail = d['available_qty'] or 0
-        
-        # Logic: Allocated = min(Req, Stock)
-        if avail >= req:
-            d['allocated_qty'] = req
-            d['status'] = "Fully Allocated"
-        elif avail > 0:
-            d['allocated_qty'] = avail
-            d['status'] = "Partial Fulfillment"
-        else:
-            d['allocated_qty'] = 0
-            d['status'] = "Out of Stock"
-            
-        d['no_record'] = False # existed in cart means valid
-        
-        # Back Order calculation: Requested Qty - Current Stock, otherwise 0
-        d['back_order'] = max(0, req - avail)
-        
-        results.append(d)
-        
-    return results
+        ).mappings().all()
 
 def remove_from_cart_db(cart_id):
     engine = get_engine()
     with engine.begin() as conn:
         conn.execute(
-            text("DELETE FROM cart WHERE id = :id"),
+            _SQL_DELETE_CART_ITEM,
             {"id": cart_id}
         )
 
@@ -306,15 +479,38 @@ def update_cart_item_db(cart_id, new_qty):
     engine = get_engine()
     with engine.begin() as conn:
         conn.execute(
-            text("UPDATE cart SET qty = :qty WHERE id = :id"),
+            _SQL_UPDATE_CART_QTY,
             {"qty": new_qty, "id": cart_id}
         )
 
+def bulk_update_cart(updates):
+    """
+    Sets the qty of many cart lines in one statement.
+    updates: iterable of (qty, cart_id) pairs.
+    """
+    updates = list(updates)
+    if not updates:
+        return
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(
+            _SQL_BULK_UPDATE_CART_QTY,
+            {"ids": [int(cid) for _, cid in updates], "qtys": [int(q) for q, _ in updates]}
+        )
+
+def bulk_remove_cart(cart_ids):
+    ids = [int(cid) for cid in cart_ids]
+    if not ids:
+        return
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(_SQL_BULK_DELETE_CART, {"ids": ids})
+
 def clear_cart_db(user_id):
     engine = get_engine()
     with engine.begin() as conn:
         conn.execute(
-            text("DELETE FROM cart WHERE user_id = :user_id"),
+            _SQL_CLEAR_CART,
             {"user_id": user_id}
         )
 
@@ -322,83 +518,50 @@ def clear_cart_db(user_id):
 def create_order(user_id, items, stock_type):
     # items is list of dict: {part_number, description, qty (This is REQUESTED), price, ...}
     
-    total_alloc_price = 0
     engine = get_engine()
     
     try:
         with engine.begin() as conn:
-            # 1. Create Order Header (Initial total 0, update later)
+            # 1. Create Order Header (Initial total 0, set by the line-item statement)
             result = conn.execute(
-                text("INSERT INTO orders (user_id, total_price, stock_type) VALUES (:uid, 0, :stype) RETURNING order_id"),
+                _SQL_INSERT_ORDER_HEADER,
                 {"uid": user_id, "stype": stock_type}
             )
             order_id = result.fetchone()[0]
             
-            for item in items:
-                # 2. Check Live Stock
-                # Lock row if possible, or just select
-                row = conn.execute(
-                    text("SELECT free_stock FROM parts_stock WHERE part_number = :pn AND stock_type = :stype"),
-                    {"pn": item['part_number'], "stype": stock_type}
-                ).fetchone()
-                
-                current_stock = row.free_stock if row else 0
-                requested_qty = item['qty'] # The user's input
-                
-                # 3. Cap Allocation
-                allocated_qty = min(requested_qty, current_stock)
-                
-                # 4. Deduct Stock (Only if allocated > 0)
-                if allocated_qty > 0:
-                    conn.execute(
-                        text("UPDATE parts_stock SET free_stock = free_stock - :qty WHERE part_number = :pn AND stock_type = :stype"),
-                        {"qty": allocated_qty, "pn": item['part_number'], "stype": stock_type}
-                    )
-                
-                # 5. Insert Line Item
-                # qty -> allocated_qty
-                # requested_qty -> requested_qty
-                
+            # 2. Allocate, deduct stock, insert line items and set the header total in one statement.
+            # Lines are allocated in input order; repeated part numbers share the stock,
+            # each line seeing what the earlier ones left (running SUM over line_no).
+            # qty -> allocated_qty, requested_qty -> requested_qty,
+            # available_qty -> snapshot of stock at time of that line
+            if items:
                 conn.execute(
-                    text("""
-                    INSERT INTO order_items 
-                    (order_id, part_number, description, qty, requested_qty, available_qty, price, supersedes)
-                    VALUES (:oid, :pn, :desc, :qty, :req, :avail, :price, :supersedes)
-                    """),
+                    _SQL_PLACE_ORDER_ITEMS,
                     {
                         "oid": order_id,
-                        "pn": item['part_number'],
-                        "desc": item['description'],
-                        "qty": allocated_qty, # SAVED AS ALLOCATED
-                        "req": requested_qty, # SAVED AS REQUESTED
-                        "avail": current_stock, # Snapshot of stock at time of order
-                        "price": item['price'],
-                        "supersedes": item.get('supersedes')
+                        "stype": stock_type,
+                        "line_nos": list(range(len(items))),
+                        "pns": [item['part_number'] for item in items],
+                        "descs": [None if pd.isna(item['description']) else item['description'] for item in items],
+                        "reqs": [int(item['qty']) for item in items], # The user's input
+                        "prices": [float(item['price'] or 0) for item in items],
+                        "sups": [None if pd.isna(item.get('supersedes')) else item.get('supersedes') for item in items]
                     }
                 )
-                
-                total_alloc_price += (allocated_qty * item['price'])
-                
-            # 6. Update Header Total
-            conn.execute(
-                text("UPDATE orders SET total_price = :tot WHERE order_id = :oid"),
-                {"tot": total_alloc_price, "oid": order_id}
-            )
             
-            # 7. Clear Cart
-            conn.execute(text("DELETE FROM cart WHERE user_id = :uid"), {"uid": user_id})
+            # 3. Clear Cart
+            conn.execute(_SQL_CLEAR_CART, {"user_id": user_id})
             
+        clear_search_cache()
+        clear_order_caches()
         return True, order_id
     except Exception as e:
         return False, str(e)
 
 # ---------- BULK PROCESSING ----------
 def process_bulk_enquiry(df_bulk, stock_type, adjustment_percent=0):
-    engine = get_engine()
-    df = df_bulk.copy()
-    
-    # Normalize headers
-    df.columns = [str(c).strip().lower() for c in df.columns]
+    # Normalize headers (rename() returns a new frame; the caller's DataFrame is left alone)
+    df = df_bulk.rename(columns=lambda c: str(c).strip().lower())
 
     # Handle S.No if exists or first column
     if 's.no' in df.columns:
@@ -442,9 +605,7 @@ def process_bulk_enquiry(df_bulk, stock_type, adjustment_percent=0):
     if missing:
         raise ValueError(f"Missing required columns: {missing}. Found: {list(df.columns)}")
 
-    # Record original sort order based on S.No or part_number
-    # We'll use s.no as the primary sorter
-    df = df.sort_values(by='s.no')
+    # Output is ordered by S.No once at the end (see the final sort), so the input is not re-sorted here
 
     # Aggregation: Group by lookup_part_number to merge duplicates IS REMOVED 
     # as per requirement to maintain original sort order and potentially multiple lines of same part.
@@ -455,20 +616,35 @@ def process_bulk_enquiry(df_bulk, stock_type, adjustment_percent=0):
         # Preserve Original
         df['original_part_number'] = df['part_number']
         # Sanitize for lookup
-        df['lookup_part_number'] = df['part_number'].apply(lambda x: sanitize_part_number(x).replace("-", ""))
+        df['lookup_part_number'] = sanitize_part_numbers_for_lookup(df['part_number'])
     
-    # Preparation
+    # Preparation: fetch only the requested parts, then the parts they are superseded by
+    stock_cols = ['part_number', 'description', 'free_stock', 'price', 'superseded']
+    lookup_keys = [k for k in df['lookup_part_number'].unique().tolist() if k]
     all_stock = []
-    with engine.connect() as conn:
-        try:
-             all_stock = conn.execute(
-                 text("SELECT part_number, description, free_stock, price, superseded FROM parts_stock WHERE stock_type = :st AND is_active = TRUE"),
-                 {"st": stock_type}
-             ).fetchall()
-        except Exception as e:
-             print(f"DB Error: {e}")
+    # DB errors propagate: bulk_order_tab reports them instead of showing every part as No Record
+    with read_connection() as conn:
+        if lookup_keys:
+            all_stock = conn.execute(
+                _SQL_BULK_STOCK,
+                {"st": stock_type, "keys": lookup_keys}
+            ).fetchall()
+
+        sup_keys = list({str(r.superseded).strip() for r in all_stock if r.superseded and str(r.superseded).strip()})
+        if sup_keys:
+            # Superseded targets are matched exactly or hyphen-insensitively (see stock_map/_norm below);
+            # rows already fetched above are excluded so the merge does not see duplicates
+            all_stock += conn.execute(
+                _SQL_BULK_SUPERSEDED_STOCK,
+                {
+                    "st": stock_type,
+                    "sup": sup_keys,
+                    "sup_norm": [k.replace("-", "") for k in sup_keys],
+                    "keys": lookup_keys
+                }
+            ).fetchall()
              
-    stock = pd.DataFrame([dict(row._mapping) for row in all_stock])
+    stock = pd.DataFrame([dict(row._mapping) for row in all_stock], columns=stock_cols)
 
     if not stock.empty:
          stock['match_key'] = stock['part_number'].apply(lambda x: str(x).replace("-", "").strip())
@@ -498,132 +674,81 @@ def process_bulk_enquiry(df_bulk, stock_type, adjustment_percent=0):
     stock_map = stock_unique.set_index('part_number', drop=False).to_dict('index')
     stock_map_norm = stock_unique_norm.set_index('match_key', drop=False).to_dict('index')
     
-    results_list = []
-    
-    for idx, row in df.iterrows():
-        orig_pn = row['original_part_number']
-        desc = row['description'] 
-        avail = row['available_qty']
-        price = row['price']
-        req_qty = row['qty']
-        sno = row[sno_col]
-        real_pn = row['real_part_number']
-        
-        if pd.isna(desc):
-             results_list.append({
-                 'S.No': sno,
-                 'original_part_number': orig_pn,
-                 'description': None,
-                 'price': 0,
-                 'available_qty': 0,
-                 'requested_qty': req_qty,
-                 'allocated_qty': 0,
-                 'back_order': req_qty,
-                 'no_record': True,
-                 'status': "Invalid Part",
-                 'allocated_part_number': None,
-                 'supersedes': None
-             })
-             continue
+    sno_num = pd.to_numeric(df[sno_col], errors='coerce')
 
-        alloc_orig = min(req_qty, avail)
-        # Back Order calculation: ALWAYS based on original part's deficit
-        # regardless of whether a superseded part was used to fulfill the remaining need.
-        back_order_orig = max(0, req_qty - alloc_orig)
-        remainder = req_qty - alloc_orig
-        
-        sup_pointer = row.get('superseded')
-        superseded_part_data = None
-        
-        if remainder > 0 and pd.notna(sup_pointer) and str(sup_pointer).strip():
-             new_pn = str(sup_pointer).strip()
-             new_pn_clean = new_pn.replace("-", "")
-             
-             if new_pn in stock_map:
-                superseded_part_data = stock_map[new_pn]
-             elif new_pn_clean in stock_map_norm:
-                superseded_part_data = stock_map_norm[new_pn_clean]
-        
-        sup_display = str(sup_pointer).strip() if pd.notna(sup_pointer) and str(sup_pointer).strip() else None
-
-        if remainder <= 0:
-            results_list.append({
-                 'S.No': str(sno),
-                 'original_part_number': orig_pn,
-                 'description': desc,
-                 'price': price,
-                 'available_qty': avail,
-                 'requested_qty': req_qty,
-                 'allocated_qty': alloc_orig,
-                 'back_order': 0,
-                 'no_record': False,
-                 'status': "Fully Allocated",
-                 'allocated_part_number': real_pn,
-                 'supersedes': sup_display
-             })
-             
-        elif superseded_part_data and int(superseded_part_data.get('free_stock') or 0) > 0:
-            # Trigger: If Requested Qty > Available Stock of the original part.
-            # Superseded Inclusion: If a superseded part exists with stock > 0, it must be added as a new row immediately below the original part.
-            
-            # Original Part Row
-            results_list.append({
-                 'S.No': str(sno),
-                 'original_part_number': orig_pn,
-                 'description': desc,
-                 'price': price,
-                 'available_qty': avail,
-                 'requested_qty': req_qty,
-                 'allocated_qty': alloc_orig,
-                 'back_order': back_order_orig,
-                 'no_record': False,
-                 'status': "Partial - Split" if alloc_orig > 0 else "Out of Stock",
-                 'allocated_part_number': real_pn,
-                 'supersedes': sup_display
-             })
+    # Allocation math for every line at once; rows with no stock record are "Invalid Part"
+    valid = df['description'].notna()
+    req_qty = df['qty']
+    alloc_orig = np.minimum(req_qty, df['available_qty'])
+    remainder = req_qty - alloc_orig
+    # Back Order calculation: ALWAYS based on original part's deficit
+    # regardless of whether a superseded part was used to fulfill the remaining need.
+    back_order_orig = remainder.clip(lower=0)
+
+    sup_display = df['superseded'].where(df['superseded'].notna()).astype(str).str.strip()
+    sup_display = sup_display.where(df['superseded'].notna() & (sup_display != ''), None)
+
+    # Trigger: If Requested Qty > Available Stock of the original part.
+    # Superseded Inclusion: If a superseded part exists with stock > 0, it must be added as a new row immediately below the original part.
+    split_parts = {}
+    for i, new_pn in sup_display[valid & (remainder > 0) & sup_display.notna()].items():
+        superseded_part_data = stock_map.get(new_pn) or stock_map_norm.get(new_pn.replace("-", ""))
+        if superseded_part_data and int(superseded_part_data.get('free_stock') or 0) > 0:
+            split_parts[i] = superseded_part_data
+    is_split = df.index.isin(list(split_parts))
 
+    status = np.select(
+        [~valid, remainder <= 0, is_split & (alloc_orig > 0), alloc_orig > 0],
+        ["Invalid Part", "Fully Allocated", "Partial - Split", "Partial"],
+        default="Out of Stock"
+    )
+
+    output_df = pd.DataFrame({
+        'S.No': df[sno_col].astype(str).where(valid, df[sno_col]),
+        'original_part_number': df['original_part_number'],
+        'description': df['description'].where(valid, None),
+        'price': df['price'].where(valid, 0),
+        'available_qty': df['available_qty'].where(valid, 0),
+        'requested_qty': req_qty,
+        'allocated_qty': alloc_orig.where(valid, 0),
+        'back_order': back_order_orig.where(valid, req_qty),
+        'no_record': ~valid,
+        'status': status,
+        'allocated_part_number': df['real_part_number'].where(valid, None),
+        'supersedes': sup_display.where(valid, None),
+        # Numeric S.No plus a 0/1 sub-key so each superseded row sorts right below its original
+        '_sort_sno': sno_num,
+        '_sort_sub': 0
+    })
+
+    # Superseded Part Rows (Sub-decimal S.No), only for the lines that split
+    if split_parts:
+        sup_rows = []
+        for i, superseded_part_data in split_parts.items():
             sup_avail = int(superseded_part_data.get('free_stock') or 0)
-            sup_price = float(superseded_part_data.get('price') or 0)
-            alloc_sup = min(remainder, sup_avail)
-            
-            # Superseded Part Row (Sub-decimal S.No)
-            results_list.append({
-                 'S.No': f"{sno}.1", 
-                 'original_part_number': orig_pn,
+            sup_rows.append({
+                 'S.No': f"{df.at[i, sno_col]}.1",
+                 'original_part_number': df.at[i, 'original_part_number'],
                  'description': f"(Superseded) {superseded_part_data['description']}",
-                 'price': sup_price,
+                 'price': float(superseded_part_data.get('price') or 0),
                  'available_qty': sup_avail,
                  'requested_qty': 0, # Requirement show (Superseded) or similar? Example shows empty or marker
-                 'allocated_qty': alloc_sup,
+                 'allocated_qty': min(remainder.at[i], sup_avail),
                  'back_order': 0, # Requirement says Back Order always on original
                  'no_record': False,
                  'status': "Superseded fulfillment",
                  'allocated_part_number': superseded_part_data['part_number'],
-                 'supersedes': None
+                 'supersedes': None,
+                 '_sort_sno': sno_num.at[i],
+                 '_sort_sub': 1
              })
-
-        else:
-            # Standard fulfillment (Partial or OOS)
-            results_list.append({
-                 'S.No': str(sno),
-                 'original_part_number': orig_pn,
-                 'description': desc,
-                 'price': price,
-                 'available_qty': avail,
-                 'requested_qty': req_qty,
-                 'allocated_qty': alloc_orig,
-                 'back_order': back_order_orig,
-                 'no_record': False,
-                 'status': "Partial" if alloc_orig > 0 else "Out of Stock",
-                 'allocated_part_number': real_pn,
-                 'supersedes': sup_display
-             })
-
-    output_df = pd.DataFrame(results_list)
+        output_df = pd.concat([output_df, pd.DataFrame(sup_rows)], ignore_index=True)
     
     if not output_df.empty:
-        # Re-sort to maintain original order
-        output_df = output_df.sort_values(by=['S.No', 'status'], ascending=[True, False]).reset_index(drop=True)
+        # Re-sort to maintain original order: numeric S.No, superseded row after its original,
+        # file order among equal S.No values
+        output_df = output_df.sort_values(by=['_sort_sno', '_sort_sub'], kind='stable').reset_index(drop=True)
+        output_df = output_df.drop(columns=['_sort_sno', '_sort_sub'])
 
         output_df['display_part_number'] = output_df['allocated_part_number'].combine_first(output_df['original_part_number'])
         
@@ -653,54 +778,45 @@ def process_bulk_enquiry(df_bulk, stock_type, adjustment_percent=0):
     return output_df
 
 # ---------- ADMIN FUNCTIONS ----------
-def get_all_orders():
-    engine = get_engine()
-    with engine.begin() as conn:
+def get_all_orders(limit=100, before_ts=None, before_id=None, stock_type=None):
+    """
+    Newest order headers first, one page at a time.
+    Pass the last row's timestamp and order_id as before_ts/before_id to fetch the next (older) page;
+    the pair is the cursor, so orders sharing the boundary timestamp are not skipped.
+    stock_type limits the page to one stock type (orders without one count as parts_stock).
+    """
+    with read_connection() as conn:
         # Get Headers
-        headers = conn.execute(
-            text("SELECT order_id, user_id, total_price, order_status, stock_type, timestamp FROM orders ORDER BY timestamp DESC")
-        ).fetchall()
-        
-    return [dict(row._mapping) for row in headers]
+        return conn.execute(
+            _SQL_ALL_ORDERS_PAGE,
+            {"before_ts": before_ts, "before_id": before_id, "limit": limit, "st": stock_type}
+        ).mappings().all()
 
 def get_order_details(order_id):
-    engine = get_engine()
-    with engine.begin() as conn:
-        rows = conn.execute(
-            text("SELECT id, order_id, part_number, description, qty, requested_qty, available_qty, price, no_record_flag, supersedes FROM order_items WHERE order_id = :oid"),
+    with read_connection() as conn:
+        return conn.execute(
+            _SQL_ORDER_DETAILS,
             {"oid": order_id}
-        ).fetchall()
-    return [dict(row._mapping) for row in rows]
+        ).mappings().all()
+
+def get_order_details_bulk(order_ids):
+    """Items for several orders in one query, as {order_id: [item, ...]} (empty list if none)."""
+    details = {oid: [] for oid in order_ids}
+    if not details:
+        return details
+    with read_connection() as conn:
+        for m in conn.execute(_SQL_ORDER_DETAILS_BULK, {"oids": list(details)}).mappings():
+            details[m['order_id']].append(m)
+    return details
 
 def restore_stock_from_order(conn, order_id):
     """
     Adds back the ALLOCATED quantity (qty) from order_items to parts_stock.
     MUST be called within an active transaction (conn).
     """
-    # 1. Get items to restore
-    items = conn.execute(
-        text("SELECT part_number, qty FROM order_items WHERE order_id = :oid"),
-        {"oid": order_id}
-    ).fetchall()
-    
-    # 2. Identify stock type from header
-    header = conn.execute(
-        text("SELECT stock_type FROM orders WHERE order_id = :oid"),
-        {"oid": order_id}
-    ).fetchone()
-    
-    if not header:
-        return # Orphaned items?
-        
-    stype = header.stock_type
-    
-    for item in items:
-        # Restore only if something was allocated
-        if item.qty > 0:
-            conn.execute(
-                text("UPDATE parts_stock SET free_stock = free_stock + :qty WHERE part_number = :pn AND stock_type = :stype"),
-                {"qty": item.qty, "pn": item.part_number, "stype": stype}
-            )
+    # One set-based UPDATE: stock type comes from the header join (orphaned items are skipped),
+    # only allocated lines count, and repeated lines of a part are summed first
+    conn.execute(_SQL_RESTORE_ORDER_STOCK, {"oid": order_id})
 
 def update_order_status(order_id, status):
     engine = get_engine()
@@ -715,14 +831,14 @@ def update_order_status(order_id, status):
             # WARNING: If Admin clicks Reject twice, it duplicates stock? 
             # Guard: Only restore if current status is NOT Rejected.
             
-            curr = conn.execute(text("SELECT order_status FROM orders WHERE order_id = :oid"), {"oid": order_id}).fetchone()
-            if curr and curr.order_status != 'Rejected' and status == 'Rejected':
-                restore_stock_from_order(conn, order_id)
-            
-            conn.execute(
-                text("UPDATE orders SET order_status = :status WHERE order_id = :oid"),
+            # Update and read the previous status in one round trip
+            prev = conn.execute(
+                _SQL_UPDATE_ORDER_STATUS,
                 {"status": status, "oid": order_id}
-            )
+            ).fetchone()
+            if prev and prev.order_status != 'Rejected' and status == 'Rejected':
+                restore_stock_from_order(conn, order_id)
+        clear_order_caches()
         return True, "Updated"
     except Exception as e:
         return False, str(e)
@@ -734,8 +850,8 @@ def delete_order(order_id):
             # RESTORE STOCK BEFORE DELETE
             restore_stock_from_order(conn, order_id)
             
-            conn.execute(text("DELETE FROM order_items WHERE order_id = :oid"), {"oid": order_id})
-            conn.execute(text("DELETE FROM orders WHERE order_id = :oid"), {"oid": order_id})
+            conn.execute(_SQL_DELETE_ORDER, {"oid": order_id})
+        clear_order_caches()
         return True, "Deleted"
     except Exception as e:
         return False, str(e)
@@ -745,12 +861,8 @@ def delete_all_users_history():
     try:
         with engine.begin() as conn:
             # Restore stock for all non-rejected orders before wiping
-            orders = conn.execute(text("SELECT order_id FROM orders WHERE order_status != 'Rejected'")).fetchall()
-            for row in orders:
-                restore_stock_from_order(conn, row.order_id)
-                
-            conn.execute(text("DELETE FROM order_items"))
-            conn.execute(text("DELETE FROM orders"))
+            conn.execute(_SQL_PURGE_ORDERS, {"st": None})
+        clear_order_caches()
         return True, "All history deleted and stock restored where applicable"
     except Exception as e:
         return False, str(e)
@@ -759,141 +871,184 @@ def delete_all_orders(stock_type):
     engine = get_engine()
     try:
         with engine.begin() as conn:
-            # Restore stock for all non-rejected orders of this type
-            orders = conn.execute(
-                text("SELECT order_id FROM orders WHERE stock_type = :st AND order_status != 'Rejected'"),
-                {"st": stock_type}
-            ).fetchall()
-            for row in orders:
-                restore_stock_from_order(conn, row.order_id)
-
-            conn.execute(
-                text("""
-                DELETE FROM order_items 
-                WHERE order_id IN (SELECT order_id FROM orders WHERE stock_type = :st)
-                """),
-                {"st": stock_type}
-            )
-            
-            # Delete Orders
-            conn.execute(
-                text("DELETE FROM orders WHERE stock_type = :st"),
-                {"st": stock_type}
-            )
-            return True, "All orders deleted and stock restored"
+            # Restore stock for non-rejected orders of this type, then delete them with their items
+            deleted = conn.execute(_SQL_PURGE_ORDERS, {"st": stock_type}).scalar()
+        clear_order_caches()
+        if not deleted:
+            return True, "No orders to delete"
+        return True, "All orders deleted and stock restored"
     except Exception as e:
         return False, str(e)
 
 # ---------- USER MANAGEMENT (ADMIN) ----------
-def get_all_users():
-    engine = get_engine()
-    with engine.begin() as conn:
-        rows = conn.execute(
-            text("SELECT user_id, user_name, mail_id, phone_number, is_active, role, assigned_stock_type, price_adjustment_percent FROM customer_details ORDER BY user_id")
-        ).fetchall()
-    results = [dict(row._mapping) for row in rows]
-    for r in results:
-        r['price_adjustment_percent'] = float(r['price_adjustment_percent'] or 0)
-    return results
+# Called with each user_id whose row changed; auth registers its login-cache eviction here
+# (auth imports logic, so logic cannot import auth back)
+_USER_CHANGE_HOOKS = []
 
-def update_user_status(user_id, is_active):
+def register_user_change_hook(hook):
+    if hook not in _USER_CHANGE_HOOKS:
+        _USER_CHANGE_HOOKS.append(hook)
+
+def invalidate_users_cache(user_ids=()):
+    with _CACHE_LOCK:
+        _USERS_CACHE.clear()
+    for uid in user_ids:
+        for hook in _USER_CHANGE_HOOKS:
+            hook(uid)
+
+def get_all_users(nocache=False):
+    if not nocache:
+        with _CACHE_LOCK:
+            cached = _USERS_CACHE.get("all")
+        if cached is not None:
+            return cached
+    with read_connection() as conn:
+        users = conn.execute(_SQL_ALL_USERS).mappings().all()
+    with _CACHE_LOCK:
+        _USERS_CACHE["all"] = users
+    return users
+
+_LEGACY_COLUMN_CLEANUP_SQL = """
+ALTER TABLE cart DROP COLUMN IF EXISTS delivery_area;
+ALTER TABLE order_items DROP COLUMN IF EXISTS delivery_area;
+"""
+
+# Columns the admin dashboard may edit (with their SQL types); the update functions only accept these keys
+_USER_EDITABLE_COLUMNS = {
+    "is_active": "BOOLEAN",
+    "role": "TEXT",
+    "assigned_stock_type": "TEXT",
+    "price_adjustment_percent": "NUMERIC",
+}
+
+def update_user(user_id, **fields):
+    """
+    Updates any of the admin-editable user columns in one statement.
+    e.g. update_user(1001, role="admin", is_active=False)
+    """
+    unknown = set(fields) - set(_USER_EDITABLE_COLUMNS)
+    if unknown:
+        return False, f"Cannot update columns: {sorted(unknown)}"
+    if not fields:
+        return True, "Nothing to update"
+
+    set_clause = ", ".join(f"{col} = :{col}" for col in fields)
     engine = get_engine()
     try:
         with engine.begin() as conn:
-            conn.execute(
-                text("UPDATE customer_details SET is_active = :status WHERE user_id = :uid"),
-                {"status": is_active, "uid": user_id}
-            )
+            # RETURNING confirms the user exists without a follow-up SELECT
+            updated = conn.execute(
+                text(f"UPDATE customer_details SET {set_clause} WHERE user_id = :uid RETURNING user_id"),
+                {**fields, "uid": user_id}
+            ).scalar()
+        if updated is None:
+            return False, "User not found"
+        invalidate_users_cache([user_id])
         return True, "Updated"
     except Exception as e:
         return False, str(e)
 
-def update_user_role(user_id, role):
+def bulk_update_users(changes):
+    """
+    Applies per-user edits from the admin table in a single statement.
+    changes: {user_id: {column: value, ...}}; columns a user did not change are left as they are.
+    """
+    changes = {uid: fields for uid, fields in changes.items() if fields}
+    if not changes:
+        return True, "Nothing to update"
+    cols = [c for c in _USER_EDITABLE_COLUMNS if any(c in f for f in changes.values())]
+    unknown = {c for f in changes.values() for c in f} - set(cols)
+    if unknown:
+        return False, f"Cannot update columns: {sorted(unknown)}"
+
+    # Per column: a "set_" flag array plus a value array, so one row can change some columns and not others
+    set_clause = ", ".join(f"{c} = CASE WHEN v.set_{c} THEN v.{c} ELSE c.{c} END" for c in cols)
+    arrays = ", ".join(
+        f"CAST(:set_{c} AS BOOLEAN[]), CAST(:{c} AS {_USER_EDITABLE_COLUMNS[c]}[])" for c in cols
+    )
+    aliases = ", ".join(f"set_{c}, {c}" for c in cols)
+    sql = text(f"""
+    UPDATE customer_details c SET {set_clause}
+    FROM unnest(CAST(:uids AS INTEGER[]), {arrays}) AS v(user_id, {aliases})
+    WHERE c.user_id = v.user_id
+    """)
+    params = {"uids": [int(uid) for uid in changes]}
+    for c in cols:
+        params[f"set_{c}"] = [c in f for f in changes.values()]
+        params[c] = [f.get(c) for f in changes.values()]
+
     engine = get_engine()
     try:
         with engine.begin() as conn:
-            conn.execute(
-                text("UPDATE customer_details SET role = :role WHERE user_id = :uid"),
-                {"role": role, "uid": user_id}
-            )
+            conn.execute(sql, params)
+        invalidate_users_cache(params["uids"])
         return True, "Updated"
     except Exception as e:
         return False, str(e)
 
+def update_user_status(user_id, is_active):
+    return update_user(user_id, is_active=is_active)
+
+def update_user_role(user_id, role):
+    return update_user(user_id, role=role)
+
 def update_user_stock_assignment(user_id, stock_type):
-    engine = get_engine()
-    try:
-        with engine.begin() as conn:
-            conn.execute(
-                text("UPDATE customer_details SET assigned_stock_type = :st WHERE user_id = :uid"),
-                {"st": stock_type, "uid": user_id}
-            )
-        return True, "Updated"
-    except Exception as e:
-        return False, str(e)
+    return update_user(user_id, assigned_stock_type=stock_type)
 
 def update_user_price_adjustment(user_id, percent):
-    engine = get_engine()
-    try:
-        with engine.begin() as conn:
-            conn.execute(
-                text("UPDATE customer_details SET price_adjustment_percent = :pct WHERE user_id = :uid"),
-                {"pct": percent, "uid": user_id}
-            )
-        return True, "Updated"
-    except Exception as e:
-        return False, str(e)
+    return update_user(user_id, price_adjustment_percent=percent)
 
 def force_schema_cleanup():
     engine = get_engine()
-    log = []
     try:
+        # Both drops in one round trip and one transaction: a failure rolls back the whole cleanup
+        # (a failed statement aborts a Postgres transaction anyway, so per-statement recovery never worked)
         with engine.begin() as conn:
-            try:
-                conn.execute(text("ALTER TABLE cart DROP COLUMN IF EXISTS delivery_area"))
-                log.append("Dropped delivery_area from cart.")
-            except Exception as e:
-                log.append(f"Cart Error: {e}")
-                
-            try:
-                conn.execute(text("ALTER TABLE order_items DROP COLUMN IF EXISTS delivery_area"))
-                log.append("Dropped delivery_area from order_items.")
-            except Exception as e:
-                log.append(f"Items Error: {e}")
-                
-        return True, " | ".join(log)
+            conn.exec_driver_sql(_LEGACY_COLUMN_CLEANUP_SQL)
+        return True, "Dropped delivery_area from cart. | Dropped delivery_area from order_items."
     except Exception as e:
         return False, str(e)
 
 # ---------- PROFILE & HISTORY ----------
 def get_stock_csv(stock_type):
-    engine = get_engine()
-    # Read active parts for the assigned stock type with aliases
-    # df = pd.read_sql(
-    #     text("""
-    #     SELECT part_number, description, free_stock as stock, price as "price($)" 
-    #     FROM parts_stock 
-    #     WHERE stock_type = :st AND is_active = TRUE
-    #     """), 
-    #     engine,
-    #     params={"st": stock_type}
-    # )
-    df = pd.read_sql(
-        text("""
-        SELECT part_number, description, free_stock as stock
-        FROM parts_stock 
-        WHERE stock_type = :st AND is_active = TRUE
-        """), 
-        engine,
-        params={"st": stock_type}
-    )
-    return df.to_csv(index=False).encode('utf-8')
+    # Active parts for the assigned stock type.
+    # Postgres formats the CSV itself; COPY takes no bind parameters, so mogrify quotes stock_type
+    buf = io.BytesIO()
+    with read_connection() as conn:
+        with conn.connection.cursor() as cur:
+            copy_sql = cur.mogrify(
+                """
+                COPY (
+                    SELECT part_number, description, free_stock as stock
+                    FROM parts_stock
+                    WHERE stock_type = %s AND is_active = TRUE
+                ) TO STDOUT WITH (FORMAT csv, HEADER)
+                """,
+                (stock_type,)
+            ).decode()
+            cur.copy_expert(copy_sql, buf)
+    return buf.getvalue()
 
 def get_user_orders(user_id):
-    engine = get_engine()
-    with engine.begin() as conn:
-        rows = conn.execute(
-            text("SELECT order_id, total_price, order_status, timestamp FROM orders WHERE user_id = :uid ORDER BY timestamp DESC"),
-            {"uid": user_id}
-        ).fetchall()
-    return [dict(row._mapping) for row in rows]
+    with read_connection() as conn:
+        return conn.execute(_SQL_USER_ORDERS, {"uid": user_id}).mappings().all()
+
+# Cached views for order history and the admin overview, which re-read on every Streamlit rerun.
+# Plain dicts so st.cache_data can pickle them; order writes above clear both caches.
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_user_orders(user_id):
+    return [dict(m) for m in get_user_orders(user_id)]
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_order_details_bulk(order_ids):
+    # order_ids must be hashable (a tuple) to key the cache
+    return {oid: [dict(m) for m in items] for oid, items in get_order_details_bulk(order_ids).items()}
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_get_all_orders(limit=100, stock_type=None):
+    return [dict(m) for m in get_all_orders(limit=limit, stock_type=stock_type)]
+
+def clear_order_caches():
+    cached_get_user_orders.clear()
+    cached_get_order_details_bulk.clear()
+    cached_get_all_orders.clear()
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import time # Added for sleep
+import hashlib
 import database
 import auth
 import logic
@@ -92,11 +94,18 @@ def login_page():
                 elif res:
                     st.session_state.logged_in = True
                     st.session_state.user = res
+                    # Keep the session across page reloads (DB users only; the admin login has no row)
+                    token = auth.issue_login_token(res["user_id"]) if res["user_id"] else None
+                    if token:
+                        st.query_params["token"] = token
                     st.success("Logged in successfully!")
                     st.rerun()
                 else:
                     st.error("Invalid credentials")
 
+            if not auth.login_tokens_enabled():
+                st.caption("Stay-signed-in is off: set `[auth] token_secret` in `.streamlit/secrets.toml`.")
+
         with tab2:
             with st.form("register_form", clear_on_submit=False):
                 new_user = st.text_input("New Username", key="reg_user")
@@ -115,60 +124,46 @@ def login_page():
                 else:
                     st.error("Username/Password required.")
 
-def show_cart_ui(user_id):
-    st.markdown("### 🛒 My Cart")
-    stock_type = st.session_state.user.get('assigned_stock_type', 'parts_stock')
-    cart_items = logic.get_user_cart(user_id, stock_type)
-    
-    if not cart_items:
-        st.info("Cart is empty.")
-        return
+def selected_totals(rows):
+    # (Total Requested, Total Allocated) for the selected editor rows; blank cells count as 0
+    price = pd.to_numeric(rows['Price'], errors='coerce').fillna(0)
+    req = pd.to_numeric(rows['Requested_Qty'], errors='coerce').fillna(0)
+    alloc = pd.to_numeric(rows['Allocated_Qty'], errors='coerce').fillna(0)
+    return float((price * req).sum()), float((price * alloc).sum())
+
+def _parent_pn(sup_text):
+    # "Supersedes <PN>" -> "<PN>"; None when the text has no such marker
+    _, sep, rest = str(sup_text or '').partition("Supersedes ")
+    return rest.strip() if sep else None
 
+def prepare_cart_df(cart_items):
     # --- PREPARE DATA FOR TABLE VIEW ---
     # Goal: Sort items so that Superseded parts appear immediately below their Original parts.
     
-    # 1. Map items
-    item_map = {item['part_number']: item for item in cart_items}
-    
-    # 2. Build Hierarchy
+    # 1. Group each item under the part it supersedes, when that part is also in the cart
+    in_cart = {item['part_number'] for item in cart_items}
     parents = []
-    children = []
-    
+    child_map = {}
     for item in cart_items:
-        sup_text = item.get('supersedes')
-        is_child = False
-        if sup_text and "Supersedes" in str(sup_text):
-            parts = str(sup_text).split("Supersedes ")
-            if len(parts) > 1:
-                parent_pn = parts[1].strip()
-                # If parent is ALSO in cart, this is a child. 
-                # If parent not in cart (standalone replacement?), treat as parent/standalone.
-                if parent_pn in item_map:
-                    children.append(item)
-                    is_child = True
-        
-        if not is_child:
+        parent_pn = _parent_pn(item.get('supersedes'))
+        if parent_pn in in_cart:
+            child_map.setdefault(parent_pn, []).append(item)
+        else:
             parents.append(item)
 
-    # 3. Sort Parents (e.g. by Timestamp or Name)
-    # Database usually returns by timestamp desc. Let's keep that or sort alphabetic?
-    # Keep DB order for parents is usually best for "recent added".
-    
+    # 2. Emit parents in DB order (most recent first), each followed by its chain of replacements
     ordered_items = []
-    # Map Children to Parent PN for fast lookup
-    child_map = {}
-    for c in children:
-        sup_text = c.get('supersedes')
-        p_pn = str(sup_text).split("Supersedes ")[1].strip()
-        if p_pn not in child_map:
-            child_map[p_pn] = []
-        child_map[p_pn].append(c)
-        
-    for p in parents:
-        ordered_items.append(p)
-        # Check for children
-        if p['part_number'] in child_map:
-            ordered_items.extend(child_map[p['part_number']])
+    seen = set()
+    stack = list(reversed(parents))
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        ordered_items.append(item)
+        stack.extend(reversed(child_map.get(item['part_number'], [])))
+    # Items caught in a supersession cycle have no root; keep them rather than drop them
+    ordered_items.extend(item for item in cart_items if id(item) not in seen)
             
     # Create DataFrame
     df = pd.DataFrame(ordered_items)
@@ -196,6 +191,45 @@ def show_cart_ui(user_id):
     cols = ['Select', 'S.No', 'Part Number', 'Description', 'Price', 'Available_Qty', 'Requested_Qty', 'Allocated_Qty', 'Back Order', 'Supersedes', 'Status', 'No Record', 'id']
     final_cols = [c for c in cols if c in df.columns]
     df = df[final_cols]
+    return df
+
+# Seconds a prepared cart frame is reused before availability is re-read
+CART_MAX_AGE = 30
+
+def invalidate_cart():
+    # Next show_cart_ui run re-reads the cart from the DB
+    st.session_state.cart_refresh += 1
+
+def place_order(user_id, items, stock_type):
+    # Every order path goes through here: create_order empties the DB cart, so the cached frame must go too
+    success, msg = logic.create_order(user_id, items, stock_type)
+    if success:
+        invalidate_cart()
+    return success, msg
+
+# Fragment: cart edits rerun only the cart; its st.rerun() calls still refresh the whole app
+@st.fragment
+def show_cart_ui(user_id):
+    st.markdown("### 🛒 My Cart")
+    stock_type = st.session_state.user.get('assigned_stock_type', 'parts_stock')
+
+    # Fetch and prepare the cart once per cart_refresh version; editor reruns reuse it.
+    # The age limit keeps availability/status from drifting while other users order.
+    cart_key = (user_id, stock_type, st.session_state.cart_refresh)
+    cart_age = time.time() - st.session_state.get("_cart_loaded_at", 0)
+    if st.session_state.get("_cart_key") != cart_key or cart_age > CART_MAX_AGE:
+        cart_items = logic.get_user_cart(user_id, stock_type)
+        st.session_state._cart_items = cart_items
+        st.session_state._cart_df = prepare_cart_df(cart_items) if cart_items else None
+        st.session_state._cart_key = cart_key
+        st.session_state._cart_loaded_at = time.time()
+    cart_items = st.session_state._cart_items
+    df = st.session_state._cart_df
+    
+    if not cart_items:
+        st.info("Cart is empty.")
+        return
+
 
     edited_df = st.data_editor(
         df,
@@ -210,40 +244,35 @@ def show_cart_ui(user_id):
     # Update DB if quantities changed
     if st.button("Save Changes & Recalculate"):
         # 1. Update/Add items
-        for index, row in edited_df.iterrows():
-             if pd.notna(row.get('id')):
-                 db_item = next((x for x in cart_items if x['id'] == row['id']), None)
+        by_id = {c['id']: c for c in cart_items}
+        updates = []
+        for row in edited_df.itertuples(index=False):
+             row_id = getattr(row, 'id', None)
+             if pd.notna(row_id):
+                 db_item = by_id.get(row_id)
                  if db_item:
-                     new_qty = row.get('Requested_Qty')
+                     new_qty = getattr(row, 'Requested_Qty', None)
                      if new_qty is not None and new_qty != db_item['qty']:
-                         logic.update_cart_item_db(row['id'], new_qty)
+                         updates.append((new_qty, row_id))
+        logic.bulk_update_cart(updates)
              
         # 2. Delete items that were removed in the editor
         # (Compare IDs in edited_df vs cart_items)
         if not edited_df.empty:
             current_ids = set(edited_df['id'].dropna())
-            for item in cart_items:
-                if item['id'] not in current_ids:
-                    logic.remove_from_cart_db(item['id'])
+            logic.bulk_remove_cart(item['id'] for item in cart_items if item['id'] not in current_ids)
         else:
             # If editor is empty, clear cart
             logic.clear_cart_db(user_id)
             
+        invalidate_cart()
         st.success("Cart Updated!")
         st.rerun()
 
     # --- TOTALS & ACTIONS ---
     selected_rows = edited_df[edited_df["Select"] == True]
     
-    total_req = 0
-    total_alloc = 0
-    
-    for _, row in selected_rows.iterrows():
-        price = row.get('Price', 0)
-        req = row.get('Requested_Qty', 0)
-        alloc = row.get('Allocated_Qty', 0)
-        total_req += price * req
-        total_alloc += price * alloc
+    total_req, total_alloc = selected_totals(selected_rows)
         
     c1, c2 = st.columns(2)
     c1.metric("Total (Requested)", f"${total_req:.2f}")
@@ -253,6 +282,7 @@ def show_cart_ui(user_id):
     with cl:
         if st.button("Clear Cart"):
             logic.clear_cart_db(user_id)
+            invalidate_cart()
             st.rerun()
     with cr:
         if st.button("Checkout Selected", type="primary", use_container_width=True):
@@ -271,12 +301,11 @@ def show_cart_ui(user_id):
                 item['supersedes'] = item.get('Supersedes')
             
             stock_type = st.session_state.user.get('assigned_stock_type', 'parts_stock')
-            success, msg = logic.create_order(user_id, items_to_order, stock_type)
+            success, msg = place_order(user_id, items_to_order, stock_type)
             
             if success:
                 # Remove ordered items
-                for _, row in selected_rows.iterrows():
-                    logic.remove_from_cart_db(row['id'])
+                logic.bulk_remove_cart(selected_rows['id'].dropna())
                 st.balloons()
                 st.success(f"Order Placed! #{msg}")
                 time.sleep(2)
@@ -286,7 +315,7 @@ def show_cart_ui(user_id):
 
 def display_order_history(user_id, key_prefix="default"):
     st.markdown("### 📜 Order History")
-    orders = logic.get_user_orders(user_id)
+    orders = logic.cached_get_user_orders(user_id)
     
     if not orders:
         st.info("No past orders.")
@@ -301,120 +330,109 @@ def display_order_history(user_id, key_prefix="default"):
     # Rename for display
     # Sort by ID desc
     user_orders = sorted(orders, key=lambda x: x['order_id'], reverse=True)
+
+    # Items for every order in one query; header totals (requested and allocated) come with the orders
+    details_by_order = logic.cached_get_order_details_bulk(tuple(o['order_id'] for o in user_orders))
     
     for row in user_orders:
-        # Calculate Dual Totals for Header
-        # We need details to sum them. 
-        # CAUTION: Fetching details for EVERY order in history might be slow if many orders.
-        # Efficient way: The 'orders' table only has total_alloc_price. 
-        # To show Total Requested in header, we need to sum it from items.
-        # We can do this on query or just fetch here.
-        
-        details = logic.get_order_details(row['order_id'])
-        
-        header_tot_req = 0
-        header_tot_alloc = 0
-        for d in details:
-            p = d.get('price', 0) or 0
-            header_tot_req += p * (d.get('requested_qty', 0) or 0)
-            header_tot_alloc += p * (d.get('qty', 0) or 0) # qty is allocated
-            
-        custom_label = f"#{row['order_id']} | {row['timestamp'].strftime('%Y-%m-%d %H:%M')} | Req: ${header_tot_req:.2f} | Alloc: ${header_tot_alloc:.2f} | {row['order_status']}"
-        
-        with st.expander(custom_label):
-            # Details View
-            if details:
-                # Helper to format filename
-                # [Source]-[Type]-[User]-[Time]
-                # Source: nmc vs hbd determined from stock_type or prefix? 
-                # Current user's stock type dictates the view usually.
-                # Or assume NMC/HBD prefix based on order's stock_type.
-                # Order row has `stock_type`.
-                src_code = "nmc" if row.get('stock_type') == 'parts_stock' else "hbd"
-                timestamp_str = datetime.now().strftime("%Y%m%d-%H%M")
-                
-                # Dual Totals
-                tot_req = 0
-                tot_alloc = 0
-                
-                d_df = pd.DataFrame(details)
-                
-                # Pre-processing for Clean display
-                # DB 'qty' is actually the Allocated amount saved in order_items.qty
-                # DB 'requested_qty' is Requested.
-                
-                # Map columns to Standard 10
-                # Map columns to Standard Headers
-                d_df['Select'] = False
-                d_df.insert(0, 'S.No', range(1, len(d_df) + 1))
-                
-                # Correct internal keys to match Standard Config
-                d_df = d_df.rename(columns={
-                    'part_number': 'Part Number',
-                    'requested_qty': 'Requested_Qty',
-                    'description': 'Description',
-                    'price': 'Price',
-                    'available_qty': 'Available_Qty',
-                    'qty': 'Allocated_Qty',
-                    'no_record_flag': 'No Record',
-                    'supersedes': 'Supersedes'
-                })
-                
-                # Back Order Calculation for display
-                if 'Requested_Qty' in d_df.columns and 'Allocated_Qty' in d_df.columns:
-                    d_df['Back Order'] = (d_df['Requested_Qty'] - d_df['Allocated_Qty']).clip(lower=0)
-                
-                # Status Calculation
-                def get_status(r):
-                    req = r.get('Requested_Qty', 0) or 0
-                    alloc = r.get('Allocated_Qty', 0) or 0
-                    if alloc >= req: return "Fully Allocated"
-                    if alloc > 0: return "Partial Fulfillment"
-                    return "Out of Stock"
-                
-                d_df['Status'] = d_df.apply(get_status, axis=1)
-                
-                # Reorder
-                cols = ['Select', 'S.No', 'Part Number', 'Description', 'Price', 'Available_Qty', 'Requested_Qty', 'Allocated_Qty', 'Back Order', 'Supersedes', 'Status', 'No Record']
-                final_cols = [c for c in cols if c in d_df.columns]
-                d_df = d_df[final_cols]
-                
-                # Calculate Totals
-                for _, i_row in d_df.iterrows():
-                    p = i_row.get('price', 0) or 0
-                    tot_req += p * (i_row.get('requested_qty', 0) or 0)
-                    tot_alloc += p * (i_row.get('allocated_qty', 0) or 0)
-                
-                c1, c2 = st.columns(2)
-                c1.metric("Total (Requested)", f"${tot_req:.2f}")
-                c2.metric("Total (Allocated)", f"${tot_alloc:.2f}")
+        details = details_by_order.get(row['order_id'], [])
+        order_history_entry(row, details, row['req_total'], row['alloc_total'], user_id, key_prefix)
 
-                st.write("Order Items:")
-                st.dataframe(
-                    d_df, 
-                    hide_index=True,
-                    column_config=get_standard_config()
-                )
-                
-                # File Name: [Source]-[Type]-[User]-[Time]
-                # Type = order-[id]
-                 
-                fname = f"{src_code}-order-{row['order_id']}-{user_id}-{timestamp_str}.csv"
-                
-                # Download Button for this order
-                # We need to construct a CSV for this order
-                csv_data = d_df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label=f"Download Order #{row['order_id']}",
-                    data=csv_data,
-                    file_name=fname,
-                    mime="text/csv",
-                    key=f"{key_prefix}_dl_{row['order_id']}"
-                )
-            else:
-                st.warning("No items found for this order.")
+# Order items are never edited after checkout, so the order id alone keys the CSV
+@st.cache_data(max_entries=500, show_spinner=False)
+def order_csv(order_id, _d_df):
+    return _d_df.to_csv(index=False).encode('utf-8')
+
+# Each order's expander is its own fragment: its widgets rerun only that expander
+@st.fragment
+def order_history_entry(row, details, header_tot_req, header_tot_alloc, user_id, key_prefix):
+    custom_label = f"#{row['order_id']} | {row['timestamp'].strftime('%Y-%m-%d %H:%M')} | Req: ${header_tot_req:.2f} | Alloc: ${header_tot_alloc:.2f} | {row['order_status']}"
+
+    with st.expander(custom_label):
+        # Details View
+        if details:
+            # Helper to format filename
+            # [Source]-[Type]-[User]-[Time]
+            # Source: nmc vs hbd determined from stock_type or prefix? 
+            # Current user's stock type dictates the view usually.
+            # Or assume NMC/HBD prefix based on order's stock_type.
+            # Order row has `stock_type`.
+            src_code = "nmc" if row.get('stock_type') == 'parts_stock' else "hbd"
+            timestamp_str = datetime.now().strftime("%Y%m%d-%H%M")
+
+            d_df = pd.DataFrame(details)
+
+            # Pre-processing for Clean display
+            # DB 'qty' is actually the Allocated amount saved in order_items.qty
+            # DB 'requested_qty' is Requested.
+
+            # Map columns to Standard 10
+            # Map columns to Standard Headers
+            d_df['Select'] = False
+            d_df.insert(0, 'S.No', range(1, len(d_df) + 1))
+
+            # Correct internal keys to match Standard Config
+            d_df = d_df.rename(columns={
+                'part_number': 'Part Number',
+                'requested_qty': 'Requested_Qty',
+                'description': 'Description',
+                'price': 'Price',
+                'available_qty': 'Available_Qty',
+                'qty': 'Allocated_Qty',
+                'no_record_flag': 'No Record',
+                'supersedes': 'Supersedes'
+            })
+
+            # Back Order Calculation for display
+            if 'Requested_Qty' in d_df.columns and 'Allocated_Qty' in d_df.columns:
+                d_df['Back Order'] = (d_df['Requested_Qty'] - d_df['Allocated_Qty']).clip(lower=0)
+
+            # Status Calculation
+            req = pd.to_numeric(d_df['Requested_Qty'], errors='coerce').fillna(0).to_numpy()
+            alloc = pd.to_numeric(d_df['Allocated_Qty'], errors='coerce').fillna(0).to_numpy()
+            d_df['Status'] = np.select(
+                [alloc >= req, alloc > 0],
+                ["Fully Allocated", "Partial Fulfillment"],
+                default="Out of Stock"
+            )
+
+            # Reorder
+            cols = ['Select', 'S.No', 'Part Number', 'Description', 'Price', 'Available_Qty', 'Requested_Qty', 'Allocated_Qty', 'Back Order', 'Supersedes', 'Status', 'No Record']
+            final_cols = [c for c in cols if c in d_df.columns]
+            d_df = d_df[final_cols]
+
+            # Dual Totals: same figures as the expander header
+            c1, c2 = st.columns(2)
+            c1.metric("Total (Requested)", f"${header_tot_req:.2f}")
+            c2.metric("Total (Allocated)", f"${header_tot_alloc:.2f}")
+
+            st.write("Order Items:")
+            st.dataframe(
+                d_df, 
+                hide_index=True,
+                column_config=get_standard_config()
+            )
+
+            # File Name: [Source]-[Type]-[User]-[Time]
+            # Type = order-[id]
+
+            fname = f"{src_code}-order-{row['order_id']}-{user_id}-{timestamp_str}.csv"
+
+            # Download Button for this order
+            # We need to construct a CSV for this order
+            csv_data = order_csv(row['order_id'], d_df)
+            st.download_button(
+                label=f"Download Order #{row['order_id']}",
+                data=csv_data,
+                file_name=fname,
+                mime="text/csv",
+                key=f"{key_prefix}_dl_{row['order_id']}"
+            )
+        else:
+            st.warning("No items found for this order.")
 
-# Standard Table Configuration
+# Standard Table Configuration (built once per process and shared; treat as read-only)
+@st.cache_resource
 def get_standard_config():
     return {
         "Select": st.column_config.CheckboxColumn("Select", default=False, width=None),
@@ -446,88 +464,91 @@ def get_standard_config():
         "qty": None
     }
 
+# Search results are a fragment: ticking rows or editing quantities reruns only this panel
+@st.fragment
+def parts_search_results(search, user_stock, user_adj):
+    results = logic.get_parts_like(search, user_stock, user_adj)
+
+    if results:
+        # Flatten each result and its supersession chain into rows (parent first), column by column.
+        # A top-level row's Supersedes shows its replacement; a replacement row shows the part it replaces.
+        # (get_parts_like already drops duplicate parts.)
+        chain_rows = []
+        for r in results:
+            sup_part = r.get('superseded_part')
+            chain_rows.append((r, sup_part['part_number'] if sup_part else None))
+            parent_pn = r['part_number']
+            while sup_part:
+                chain_rows.append((sup_part, parent_pn))
+                parent_pn = sup_part['part_number']
+                sup_part = sup_part.get('superseded_part')
+
+        available = [int(p.get('free_stock') or 0) for p, _ in chain_rows]
+        df_results = pd.DataFrame({
+            'S.No': range(1, len(chain_rows) + 1),
+            'Part Number': [p['part_number'] for p, _ in chain_rows],
+            'Description': [p['description'] for p, _ in chain_rows],
+            'Price': [p['price'] for p, _ in chain_rows],
+            'Available_Qty': available,
+            'Requested_Qty': [1 if a > 0 else 0 for a in available],
+            'Supersedes': [sup for _, sup in chain_rows],
+            'Select': False
+        })
+
+        # Show results in data_editor
+        edited_results = st.data_editor(
+            df_results,
+            key="enquiry_editor",
+            hide_index=True,
+            column_config=get_standard_config(),
+            use_container_width=True
+        )
+
+        if st.button("Add Selected to Cart", type="primary", use_container_width=True):
+            selected = edited_results[edited_results['Select'] == True]
+            if selected.empty:
+                st.warning("No items selected.")
+            else:
+                for _, row in selected.iterrows():
+                    # Find the matching result object to handle recursive supersession if needed
+                    # But for the table view, we just add the part directly as selected.
+                    # Requirement: "Selection & Cart Entry: * Include a checkbox for item selection and a dedicated Required Qty input field on each row."
+
+                    logic.add_to_cart_db(
+                        st.session_state.user['user_id'],
+                        row['Part Number'],
+                        row['Description'],
+                        row['Requested_Qty'],
+                        row['Price'],
+                        supersedes=row['Supersedes'] if row['Supersedes'] else None
+                    )
+                invalidate_cart()
+                st.success("Selected items added to cart!")
+                time.sleep(0.5)
+                st.rerun()
+    else:
+        st.warning("No parts found.")
+
+# Submitting a search (Enter/blur) reruns only this panel, not the cart and order history
+@st.fragment
+def search_panel():
+    st.markdown("### 🔍 Search Parts")
+    search = st.text_input("Search Part Number or Description", placeholder="Type to search...", label_visibility="collapsed")
+    
+    if search.strip():
+        user_stock = st.session_state.user.get('assigned_stock_type', 'parts_stock')
+        user_adj = st.session_state.user.get('price_adjustment_percent', 0.0)
+        parts_search_results(search, user_stock, user_adj)
+    else:
+        st.info("Start typing to search for parts...")
+
 def parts_enquiry_tab():
     st.subheader("Parts Enquiry & Cart")
     
     col_search, col_cart = st.columns([1, 1], gap="medium")
     
     with col_search:
-        st.markdown("### 🔍 Search Parts")
-        search = st.text_input("Search Part Number or Description", placeholder="Type to search...", label_visibility="collapsed")
-        
-        if search:
-            user_stock = st.session_state.user.get('assigned_stock_type', 'parts_stock')
-            user_adj = st.session_state.user.get('price_adjustment_percent', 0.0)
-            results = logic.get_parts_like(search, user_stock, user_adj)
-            
-            if results:
-                # Convert results to DataFrame for table view
-                res_data = []
-                s_no_counter = 1
-                
-                def add_to_results(part_obj, is_superseded=False, parent_pn=None):
-                    nonlocal s_no_counter
-                    pn = part_obj.part_number
-                    
-                    # Avoid duplicates in the same search result view if possible
-                    # (Though get_parts_like already has seen_parts logic)
-                    
-                    res_data.append({
-                        'S.No': s_no_counter,
-                        'Part Number': pn,
-                        'Description': part_obj.description,
-                        'Price': part_obj.price,
-                        'Available_Qty': int(getattr(part_obj, 'free_stock', 0) or 0),
-                        'Requested_Qty': 1 if int(getattr(part_obj, 'free_stock', 0) or 0) > 0 else 0,
-                        'Supersedes': parent_pn if is_superseded else getattr(part_obj, 'superseded_part', None).part_number if hasattr(part_obj, 'superseded_part') and part_obj.superseded_part else None,
-                        'Select': False
-                    })
-                    s_no_counter += 1
-                    
-                    # Recursively add superseded parts if they exist
-                    sup_part = getattr(part_obj, 'superseded_part', None)
-                    if sup_part:
-                        add_to_results(sup_part, is_superseded=True, parent_pn=pn)
-
-                for r in results:
-                    add_to_results(r)
-                    
-                df_results = pd.DataFrame(res_data)
-                
-                # Show results in data_editor
-                edited_results = st.data_editor(
-                    df_results,
-                    key="enquiry_editor",
-                    hide_index=True,
-                    column_config=get_standard_config(),
-                    use_container_width=True
-                )
-                
-                if st.button("Add Selected to Cart", type="primary", use_container_width=True):
-                    selected = edited_results[edited_results['Select'] == True]
-                    if selected.empty:
-                        st.warning("No items selected.")
-                    else:
-                        for _, row in selected.iterrows():
-                            # Find the matching result object to handle recursive supersession if needed
-                            # But for the table view, we just add the part directly as selected.
-                            # Requirement: "Selection & Cart Entry: * Include a checkbox for item selection and a dedicated Required Qty input field on each row."
-                            
-                            logic.add_to_cart_db(
-                                st.session_state.user['user_id'],
-                                row['Part Number'],
-                                row['Description'],
-                                row['Requested_Qty'],
-                                row['Price'],
-                                supersedes=row['Supersedes'] if row['Supersedes'] else None
-                            )
-                        st.success("Selected items added to cart!")
-                        time.sleep(0.5)
-                        st.rerun()
-            else:
-                st.warning("No parts found.")
-        else:
-            st.info("Start typing to search for parts...")
+        search_panel()
 
     with col_cart:
         show_cart_ui(st.session_state.user['user_id'])
@@ -535,6 +556,35 @@ def parts_enquiry_tab():
     st.divider()
     display_order_history(st.session_state.user['user_id'], key_prefix="enquiry")
 
+def read_upload_csv(uploaded, **kwargs):
+    # pyarrow's multithreaded reader ships with Streamlit; fall back to the C parser without it
+    try:
+        return pd.read_csv(uploaded, engine="pyarrow", **kwargs)
+    except ImportError:
+        uploaded.seek(0)
+        return pd.read_csv(uploaded, **kwargs)
+
+def read_stock_csv(uploaded):
+    # Parse only the columns upload_parts_stock keeps; text columns stay text so part numbers keep leading zeros
+    header = pd.read_csv(uploaded, nrows=0).columns
+    uploaded.seek(0)
+    targets = {c: logic.stock_upload_target(c) for c in header}
+    usecols = [c for c, t in targets.items() if t]
+    dtype = {c: str for c, t in targets.items() if t in ('part_number', 'description', 'superseded')}
+    return read_upload_csv(uploaded, usecols=usecols, dtype=dtype)
+
+def parsed_stock_upload(uploaded, state_key):
+    # Reruns from unrelated widgets reuse the parsed frame until the file content changes
+    file_hash = hashlib.blake2b(uploaded.getvalue(), digest_size=8).hexdigest()
+    parsed = st.session_state.get(state_key)
+    if parsed is None or parsed[0] != file_hash:
+        parsed = (file_hash, read_stock_csv(uploaded))
+        st.session_state[state_key] = parsed
+    return parsed[1]
+
+# Bulk upload template (same bytes pandas produced for the one-row example)
+BULK_TEMPLATE_CSV = b"part_number,qty\nEXAMPLE-123,10\n"
+
 def bulk_order_tab():
     st.subheader("Bulk Order Upload")
     
@@ -543,10 +593,9 @@ def bulk_order_tab():
         st.info("Upload CSV with columns: part_number, qty. Description and Price will be fetched automatically.")
     with col_dl:
         # Template
-        template_df = pd.DataFrame([{"part_number": "EXAMPLE-123", "qty": 10}])
         st.download_button(
             label="📥 Download Template",
-            data=template_df.to_csv(index=False).encode('utf-8'),
+            data=BULK_TEMPLATE_CSV,
             file_name="bulk_order_template.csv",
             mime="text/csv",
             key="bulk_templ_btn"
@@ -563,16 +612,19 @@ def bulk_order_tab():
         try:
             # If a new file is uploaded, process it
             # FIX: Only process if NOT in success state (to avoid overwriting success msg)
-            if st.session_state.bulk_stage != "success" and (st.session_state.bulk_stage != "review" or uploaded.name != st.session_state.get("last_uploaded_file_name")):
-                df_in = pd.read_csv(uploaded)
+            # Keyed on content, so a re-upload under the same name is still picked up
+            file_hash = hashlib.blake2b(uploaded.getvalue(), digest_size=8).hexdigest()
+            if st.session_state.bulk_stage != "success" and (st.session_state.bulk_stage != "review" or file_hash != st.session_state.get("last_uploaded_file_hash")):
+                df_in = read_upload_csv(uploaded)
                 user_stock = st.session_state.user.get('assigned_stock_type', 'parts_stock')
                 user_adj = st.session_state.user.get('price_adjustment_percent', 0.0)
                 review_df = logic.process_bulk_enquiry(df_in, user_stock, user_adj)
                 st.session_state.bulk_df = review_df
                 st.session_state.bulk_stage = "review"
-                st.session_state.last_uploaded_file_name = uploaded.name
+                st.session_state.last_uploaded_file_hash = file_hash
             
-            bulk_df = st.session_state.bulk_df.copy() # Work with a copy
+            # No copy needed: assign/rename below return new frames, so session state is never mutated
+            bulk_df = st.session_state.bulk_df
             
             st.info("Markup: Edit values below. Uncheck items to exclude from order.")
             
@@ -589,19 +641,9 @@ def bulk_order_tab():
             # Ensure columns are present for config mapping
             # logic.py returns capitalized headers.
             
-            # Ensure Select
-            if 'Select' not in bulk_df.columns:
-                bulk_df.insert(0, 'Select', True)
-            
-            # Columns to Show (Streamlit data_editor shows columns in this order)
-            cols = ['Select', 'S.No', 'Part Number', 'Description', 'Price', 'Available_Qty', 'Requested_Qty', 'Allocated_Qty', 'Back Order', 'Supersedes', 'Status', 'No Record', 'real_part_number']
-            
-            # Ensure columns are present for config mapping
-            # logic.py returns capitalized headers: Part Number, Requested_Qty, etc.
-            
-            # Ensure Select
+            # Ensure Select (position comes from the column slice below)
             if 'Select' not in bulk_df.columns:
-                bulk_df.insert(0, 'Select', True)
+                bulk_df = bulk_df.assign(Select=True)
             
             # Columns to Show (Streamlit data_editor shows columns in this order)
             cols = ['Select', 'S.No', 'Part Number', 'Description', 'Price', 'Available_Qty', 'Requested_Qty', 'Allocated_Qty', 'Back Order', 'Supersedes', 'Status', 'No Record', 'real_part_number']
@@ -630,7 +672,7 @@ def bulk_order_tab():
                  if st.button("Start New Bulk Order"):
                      st.session_state.bulk_stage = None # Go back to start
                      st.session_state.pop("bulk_df", None) # Clear data
-                     st.session_state.pop("last_uploaded_file_name", None)
+                     st.session_state.pop("last_uploaded_file_hash", None)
                      st.rerun()
             else:
                 edited_df = st.data_editor(
@@ -647,15 +689,7 @@ def bulk_order_tab():
                     selected_rows = edited_df[edited_df["Select"] == True]
                     
                     # Recalculate Total on Fly
-                    total_est_req = 0
-                    total_est_alloc = 0
-                    
-                    for _, row in selected_rows.iterrows():
-                        p = row.get('Price', 0)
-                        if pd.notna(p):
-                            total_est_req += p * (row.get('Requested_Qty', 0) or 0)
-                            alloc = row.get('Allocated_Qty', 0)
-                            total_est_alloc += p * alloc
+                    total_est_req, total_est_alloc = selected_totals(selected_rows)
                     
                     c1, c2 = st.columns(2)
                     c1.metric("Total (Requested)", f"${total_est_req:.2f}")
@@ -665,30 +699,32 @@ def bulk_order_tab():
                         if selected_rows.empty:
                             st.warning("No rows selected.")
                         else:
-                            # Validation loop
-                            valid_items = []
-                            for _, row in selected_rows.iterrows():
-                                 if not row.get('No Record', False):
-                                     # Use REAL Part Number if available (for supersession)
-                                     pn = row.get('real_part_number')
-                                     if pd.isna(pn) or str(pn) == "":
-                                         pn = row['Part Number']
-                                         
-                                     # Standardize Item Dict for Create Order
-                                     item = {
-                                         "part_number": pn,
-                                         "description": row['Description'],
-                                         "qty": int(row['Requested_Qty']), # Req Qty
-                                         "price": float(row['Price']),
-                                         "supersedes": row.get('Supersedes')
-                                     }
-                                     valid_items.append(item)
+                            # Validation: skip rows flagged No Record
+                            if 'No Record' in selected_rows.columns:
+                                order_rows = selected_rows[~selected_rows['No Record'].astype(bool)]
+                            else:
+                                order_rows = selected_rows
+
+                            # Use REAL Part Number if available (for supersession)
+                            pn = order_rows['Part Number']
+                            if 'real_part_number' in order_rows.columns:
+                                real_pn = order_rows['real_part_number']
+                                pn = real_pn.where(real_pn.notna() & (real_pn.astype(str) != ""), pn)
+
+                            # Standardize Item Dicts for Create Order
+                            valid_items = pd.DataFrame({
+                                "part_number": pn,
+                                "description": order_rows['Description'],
+                                "qty": order_rows['Requested_Qty'].astype(int), # Req Qty
+                                "price": order_rows['Price'].astype(float),
+                                "supersedes": order_rows['Supersedes'] if 'Supersedes' in order_rows.columns else None
+                            }).to_dict('records')
                             
                             if not valid_items:
                                  st.warning("No valid items to order (Check allocation).")
                             else:
                                 stock_type = st.session_state.user.get('assigned_stock_type', 'parts_stock')
-                                success, msg = logic.create_order(st.session_state.user['user_id'], valid_items, stock_type)
+                                success, msg = place_order(st.session_state.user['user_id'], valid_items, stock_type)
                                 
                                 if success:
                                     st.session_state.bulk_stage = "success"
@@ -700,14 +736,14 @@ def bulk_order_tab():
             st.error(f"Error processing file: {e}")
             st.session_state.bulk_stage = None # Reset stage on error
             st.session_state.pop("bulk_df", None)
-            st.session_state.pop("last_uploaded_file_name", None)
+            st.session_state.pop("last_uploaded_file_hash", None)
     elif st.session_state.bulk_stage == "success":
         # If no file uploaded but previous state was success, show success message
         st.success("Bulk Order Processed Successfully! See Order History below.")
         if st.button("Start New Bulk Order"):
             st.session_state.bulk_stage = None
             st.session_state.pop("bulk_df", None)
-            st.session_state.pop("last_uploaded_file_name", None)
+            st.session_state.pop("last_uploaded_file_hash", None)
             st.rerun()
     else:
         st.info("Upload a CSV file to begin a bulk order.")
@@ -715,16 +751,52 @@ def bulk_order_tab():
     st.divider()
     display_order_history(st.session_state.user['user_id'], key_prefix="bulk")
 
+# One stock type's upload/reset pane; as a fragment its widgets rerun only this pane
+@st.fragment
+def stock_pane(stock_type, key_suffix, caption, upload_label):
+    st.caption(caption)
+    col1, col2 = st.columns(2)
+    with col1:
+         uploaded = st.file_uploader(f"{upload_label} (CSV: part_number, description, stock, price($))", type="csv", key=f"up_{key_suffix}")
+         if uploaded:
+             try:
+                 df = parsed_stock_upload(uploaded, f"parsed_up_{key_suffix}")
+                 if st.button(f"Upload to {stock_type}"):
+                    with st.status(f"Uploading {stock_type}...", expanded=True) as status:
+                        logic.upload_parts_stock(df, stock_type)
+                        status.update(label="Upload complete!", state="complete", expanded=False)
+                    st.success(f"Successfully uploaded {len(df)} records to {stock_type}")
+             except Exception as e:
+                 st.error(f"Error: {e}")
+    with col2:
+        st.warning("Danger Zone")
+        with st.popover(f"RESET {stock_type.replace('_', ' ').upper()}", use_container_width=True):
+            st.warning(f"Are you sure you want to delete ALL data for {stock_type}? This cannot be undone.")
+            if st.button("Confirm Reset", type="primary", key=f"confirm_reset_{key_suffix}"):
+                with st.status("Resetting stock...", expanded=True) as status:
+                    logic.reset_stock(stock_type)
+                    status.update(label="Stock reset complete!", state="complete", expanded=False)
+                st.success(f"Stock reset successfully for {stock_type}")
+                st.rerun()
+
+USER_ROLE_OPTIONS = ["Standard User", "Admin"]
+STOCK_TYPE_OPTIONS = ["parts_stock", "HBD_stock"]
+
 def admin_dashboard():
     st.subheader("Admin Dashboard")
     
     # 1. User Management (Editable)
     st.markdown("### 👥 User Management")
-    users = logic.get_all_users()
+    refresh_users = st.button("🔄 Refresh Users", key="refresh_users")
+    users = logic.get_all_users(nocache=refresh_users)
     if users:
         df_users = pd.DataFrame(users)
         # Ensure correct column order and types
         df_users['assigned_stock_type'] = df_users['assigned_stock_type'].fillna('parts_stock')
+        # Low-cardinality text as category; the categories include every selectbox option so any pick is valid
+        for col, opts in [('role', USER_ROLE_OPTIONS), ('assigned_stock_type', STOCK_TYPE_OPTIONS)]:
+            cats = list(dict.fromkeys(opts + df_users[col].dropna().tolist()))
+            df_users[col] = df_users[col].astype(pd.CategoricalDtype(cats))
         
         edited_users = st.data_editor(
             df_users,
@@ -736,48 +808,44 @@ def admin_dashboard():
                 "mail_id": st.column_config.TextColumn("Email", disabled=True, width=None),
                 "phone_number": st.column_config.TextColumn("Phone", disabled=True, width=None),
                 "is_active": st.column_config.CheckboxColumn("Active?", default=False, width=None),
-                "role": st.column_config.SelectboxColumn("Role", options=["Standard User", "Admin"], width=None),
-                "assigned_stock_type": st.column_config.SelectboxColumn("Assigned Stock", options=["parts_stock", "HBD_stock"], width=None),
+                "role": st.column_config.SelectboxColumn("Role", options=USER_ROLE_OPTIONS, width=None),
+                "assigned_stock_type": st.column_config.SelectboxColumn("Assigned Stock", options=STOCK_TYPE_OPTIONS, width=None),
                 "price_adjustment_percent": st.column_config.NumberColumn("Price Adj %", format="%.2f%%", help="Positive for markup, Negative for discount", width=None)
             },
             use_container_width=True
         )
         
         if st.button("Save User Changes"):
-            # Compare original vs edited to apply updates
-            # Ideally we only update changed rows.
-            # For simplicity, we loop all and update if changed (or just update all if small).
-            # Let's iterate over edited_users.
-            
-            for index, row in edited_users.iterrows():
-                # Find original
-                orig = next((u for u in users if u['user_id'] == row['user_id']), None)
-                if orig:
-                    # Update Status
-                    if row['is_active'] != orig['is_active']:
-                        logic.update_user_status(row['user_id'], row['is_active'])
-                    # Update Role
-                    if row['role'] != orig['role']:
-                        logic.update_user_role(row['user_id'], row['role'])
-                    # Update Stock Assignment
-                    # Update Stock Assignment
-                    if row['assigned_stock_type'] != orig['assigned_stock_type']:
-                        logic.update_user_stock_assignment(row['user_id'], row['assigned_stock_type'])
-                    # Update Price Adjustment
-                    # Handle NaN or None
-                    new_adj = row.get('price_adjustment_percent', 0)
-                    orig_adj = orig.get('price_adjustment_percent', 0)
-                    # Convert to float for comparison
-                    try:
-                        new_adj = float(new_adj)
-                    except: 
-                        new_adj = 0.0
-                        
-                    if new_adj != float(orig_adj):
-                        logic.update_user_price_adjustment(row['user_id'], new_adj)
+            # Compare original vs edited column by column, aligned on user_id
+            orig_df = pd.DataFrame(users).set_index('user_id')
+            new_df = edited_users.set_index('user_id')
+            orig_df = orig_df.reindex(new_df.index)
+
+            # Price adjustment: blanks/unparseable count as 0
+            orig_df['price_adjustment_percent'] = pd.to_numeric(orig_df['price_adjustment_percent'], errors='coerce').fillna(0.0).astype(float)
+            new_df['price_adjustment_percent'] = pd.to_numeric(new_df['price_adjustment_percent'], errors='coerce').fillna(0.0).astype(float)
+
+            # Collect every changed field so each user is one UPDATE
+            changes_by_user = {}
+            for col in ['is_active', 'role', 'assigned_stock_type', 'price_adjustment_percent']:
+                new_col, orig_col = new_df[col], orig_df[col]
+                if col == 'price_adjustment_percent':
+                    # Tolerant float compare, so editor float round-off is not saved as a change
+                    changed = ~np.isclose(new_col.to_numpy(), orig_col.to_numpy())
+                else:
+                    changed = new_col.ne(orig_col) & ~(new_col.isna() & orig_col.isna())
+                # astype(object) hands the DB plain Python values rather than numpy scalars
+                for uid, val in new_col[changed].astype(object).items():
+                    changes_by_user.setdefault(int(uid), {})[col] = val
+
+            # bulk_update_users also drops the changed users' cached logins
+            success, msg = logic.bulk_update_users(changes_by_user)
             
-            st.success("User updates saved!")
-            st.rerun()
+            if success:
+                st.success("User updates saved!")
+                st.rerun()
+            else:
+                st.error(f"Failed to save user changes: {msg}")
     else:
         st.info("No users found.")
         
@@ -787,7 +855,7 @@ def admin_dashboard():
     col_reset_1, col_reset_2 = st.columns(2)
     with col_reset_1:
          # Searchable Dropdown
-         options = [f"{u['user_id']} | {u['user_name']}" for u in users]
+         options = [f"{uid} | {name}" for uid, name in zip(df_users['user_id'].values, df_users['user_name'].values)] if users else []
          selected_reset = st.selectbox("Select User (ID | Name)", options, index=None, placeholder="Type to search ID or Name")
          temp_pass = st.selectbox("Temporary Password", options=["temp_pass_123", "password", "123456"]) # Replaced text_input with selectbox
     with col_reset_2:
@@ -795,10 +863,9 @@ def admin_dashboard():
          st.write("")
          if st.button("Reset Password"):
              if selected_reset and temp_pass:
-                 # Extract ID
-                 target_uid = int(selected_reset.split(" | ")[0])
-                 # Find name for msg
-                 target_name = selected_reset.split(" | ")[1]
+                 # Extract ID and name (for msg); names may themselves contain " | "
+                 uid_part, target_name = selected_reset.split(" | ", 1)
+                 target_uid = int(uid_part)
                  
                  success, msg = auth.reset_password_admin(target_uid, temp_pass)
                  if success:
@@ -815,85 +882,35 @@ def admin_dashboard():
     tab_parts, tab_hbd = st.tabs(["Parts Stock", "HBD Stock"])
     
     with tab_parts:
-        st.caption("Manage Standard Parts Stock")
-        col1, col2 = st.columns(2)
-        with col1:
-             up_p = st.file_uploader("Upload Parts Stock (CSV: part_number, description, stock, price($))", type="csv", key="up_parts")
-             if up_p:
-                 try:
-                     df = pd.read_csv(up_p)
-                     upload_stype = "parts_stock"
-                     if st.button(f"Upload to {upload_stype}"):
-                        with st.status(f"Uploading {upload_stype}...", expanded=True) as status:
-                            logic.upload_parts_stock(df, upload_stype)
-                            status.update(label="Upload complete!", state="complete", expanded=False)
-                        st.success(f"Successfully uploaded {len(df)} records to {upload_stype}")
-                 except Exception as e:
-                     st.error(f"Error: {e}")
-        with col2:
-            st.warning("Danger Zone")
-            stock_type_to_reset = "parts_stock"
-            with st.popover(f"RESET {stock_type_to_reset.replace('_', ' ').upper()}", use_container_width=True):
-                st.warning(f"Are you sure you want to delete ALL data for {stock_type_to_reset}? This cannot be undone.")
-                if st.button("Confirm Reset", type="primary", key="confirm_reset_parts"):
-                    with st.status("Resetting stock...", expanded=True) as status:
-                        logic.reset_stock(stock_type_to_reset)
-                        status.update(label="Stock reset complete!", state="complete", expanded=False)
-                    st.success(f"Stock reset successfully for {stock_type_to_reset}")
-                    st.rerun()
+        stock_pane("parts_stock", "parts", "Manage Standard Parts Stock", "Upload Parts Stock")
 
     with tab_hbd:
-        st.caption("Manage HBD Stock")
-        col1, col2 = st.columns(2)
-        with col1:
-             up_h = st.file_uploader("Upload HBD Stock (CSV: part_number, description, stock, price($))", type="csv", key="up_hbd")
-             if up_h:
-                 try:
-                     df = pd.read_csv(up_h)
-                     upload_stype = "HBD_stock"
-                     if st.button(f"Upload to {upload_stype}"):
-                        with st.status(f"Uploading {upload_stype}...", expanded=True) as status:
-                            logic.upload_parts_stock(df, upload_stype)
-                            status.update(label="Upload complete!", state="complete", expanded=False)
-                        st.success(f"Successfully uploaded {len(df)} records to {upload_stype}")
-                 except Exception as e:
-                     st.error(f"Error: {e}")
-        with col2:
-            st.warning("Danger Zone")
-            stock_type_to_reset = "HBD_stock"
-            with st.popover(f"RESET {stock_type_to_reset.replace('_', ' ').upper()}", use_container_width=True):
-                st.warning(f"Are you sure you want to delete ALL data for {stock_type_to_reset}? This cannot be undone.")
-                if st.button("Confirm Reset", type="primary", key="confirm_reset_hbd"):
-                    with st.status("Resetting stock...", expanded=True) as status:
-                        logic.reset_stock(stock_type_to_reset)
-                        status.update(label="Stock reset complete!", state="complete", expanded=False)
-                    st.success(f"Stock reset successfully for {stock_type_to_reset}")
-                    st.rerun()
+        stock_pane("HBD_stock", "hbd", "Manage HBD Stock", "Upload HBD Stock")
 
     st.divider()
 
     # 3. Order Management & Oversight (Split Tables)
     st.markdown("### 📋 Orders Overview")
-    orders = logic.get_all_orders()
+    if "orders_limit" not in st.session_state:
+        st.session_state.orders_limit = 100
+    orders_limit = st.session_state.orders_limit
+    # Separate orders: each tab's page is filtered by stock type in SQL (older null stock_type counts as parts_stock)
+    parts_orders = logic.cached_get_all_orders(limit=orders_limit, stock_type="parts_stock")
+    hbd_orders = logic.cached_get_all_orders(limit=orders_limit, stock_type="HBD_stock")
     
-    if orders:
-        # Separate orders
-        df_orders = pd.DataFrame(orders)
-        # Ensure stock_type exists (older orders might be null)
-        if 'stock_type' not in df_orders.columns:
-             df_orders['stock_type'] = 'parts_stock'
-        df_orders['stock_type'] = df_orders['stock_type'].fillna('parts_stock')
-        
-        parts_orders = df_orders[df_orders['stock_type'] == 'parts_stock']
-        hbd_orders = df_orders[df_orders['stock_type'] == 'HBD_stock']
-        
+    if parts_orders or hbd_orders:
         t1, t2 = st.tabs(["Parts Orders", "HBD Orders"])
         
-        for tab, data, label in [(t1, parts_orders, "Parts"), (t2, hbd_orders, "HBD")]:
+        for tab, orders, label in [(t1, parts_orders, "Parts"), (t2, hbd_orders, "HBD")]:
             with tab:
-                if data.empty:
+                if not orders:
                     st.info(f"No {label} orders.")
                 else:
+                    data = pd.DataFrame(orders)
+                    data['stock_type'] = data['stock_type'].fillna('parts_stock')
+                    # Items for every listed order in one (cached) query instead of one per expander
+                    details_by_order = logic.cached_get_order_details_bulk(tuple(o['order_id'] for o in orders))
+                    
                     st.dataframe(
                         data,
                         column_config={
@@ -925,23 +942,29 @@ def admin_dashboard():
                     # Implementing actions in a bulk table is hard in pure Streamlit without custom components or data_editor with callback.
                     # Let's use the Expander loop approach for detailed actions as it was before, but filtered.
                     
-                    for index, order in data.iterrows():
-                        with st.expander(f"#{order['order_id']} | User: {order['user_id']} | ${order['total_price']} | {order['order_status']}"):
-                            details = logic.get_order_details(order['order_id'])
-                            st.dataframe(pd.DataFrame(details))
+                    for order in data.itertuples(index=False):
+                        oid = int(order.order_id)
+                        with st.expander(f"#{oid} | User: {order.user_id} | ${order.total_price} | {order.order_status}"):
+                            details = details_by_order.get(oid, [])
+                            st.dataframe(details)
                             
                             c1, c2, c3 = st.columns(3)
-                            if st.button("✅ Accept", key=f"acc_{label}_{order['order_id']}"):
-                                logic.update_order_status(order['order_id'], "Accepted")
+                            if st.button("✅ Accept", key=f"acc_{label}_{oid}"):
+                                logic.update_order_status(oid, "Accepted")
                                 st.rerun()
-                            if st.button("❌ Reject", key=f"rej_{label}_{order['order_id']}"):
-                                logic.update_order_status(order['order_id'], "Rejected")
+                            if st.button("❌ Reject", key=f"rej_{label}_{oid}"):
+                                logic.update_order_status(oid, "Rejected")
                                 st.rerun()
-                            if st.button("🗑️ Delete", key=f"del_one_{label}_{order['order_id']}"):
-                                logic.delete_order(order['order_id'])
+                            if st.button("🗑️ Delete", key=f"del_one_{label}_{oid}"):
+                                logic.delete_order(oid)
                                 st.success("Deleted")
                                 st.rerun()
         
+        if len(parts_orders) >= orders_limit or len(hbd_orders) >= orders_limit:
+            if st.button("Load older orders", key="load_more_orders"):
+                st.session_state.orders_limit += 100
+                st.rerun()
+
         st.divider()
         st.warning("⚠️ GLOBAL DATA DELETION")
         with st.popover("DELETE ALL USERS' ORDER HISTORY (Global Wipe)", use_container_width=True):
@@ -1007,6 +1030,7 @@ def main_app():
     if st.sidebar.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.user = None
+        st.query_params.pop("token", None)
         st.rerun()
         
     # Main Content
@@ -1049,35 +1073,37 @@ def main_app():
             st.divider()
             st.markdown("### 📥 Data Export")
             user_stock = st.session_state.user.get('assigned_stock_type', 'parts_stock')
-            csv_data = logic.get_stock_csv(user_stock)
             
-            # Name: [Source]-[Type]-[User]-[Time]
-            src_code = "nmc" if user_stock == 'parts_stock' else "hbd"
-            timestamp_str = datetime.now().strftime("%Y%m%d-%H%M")
-            fname = f"{src_code}-stock-{user['user_id']}-{timestamp_str}.csv"
+            # The export is a full stock read, so it only runs on request; the bytes are kept for the download
+            if st.button(f"Prepare My Stock File ({user_stock})"):
+                # Name: [Source]-[Type]-[User]-[Time]
+                src_code = "nmc" if user_stock == 'parts_stock' else "hbd"
+                timestamp_str = datetime.now().strftime("%Y%m%d-%H%M")
+                fname = f"{src_code}-stock-{user['user_id']}-{timestamp_str}.csv"
+                st.session_state.stock_export = (user_stock, fname, logic.get_stock_csv(user_stock))
             
-            st.download_button(
-                label=f"Download My Stock File ({user_stock})",
-                data=csv_data,
-                file_name=fname,
-                mime="text/csv"
-            )
+            export = st.session_state.get("stock_export")
+            if export and export[0] == user_stock:
+                _, fname, csv_data = export
+                st.download_button(
+                    label=f"Download My Stock File ({user_stock})",
+                    data=csv_data,
+                    file_name=fname,
+                    mime="text/csv"
+                )
 
 if not st.session_state.logged_in:
     # Persistence Check
     token = st.query_params.get("token")
     if token:
-        # Simple Insecure Token currently just User ID
-        try:
-            uid = int(token)
-            users = auth.get_all_users()
-            u = next((x for x in users if x['user_id'] == uid), None)
-            if u:
-                st.session_state.logged_in = True
-                st.session_state.user = u
-                st.rerun()
-        except:
-             pass
+        # Signed token, bound to the user's current password hash
+        u = auth.user_from_login_token(token)
+        if u:
+            st.session_state.logged_in = True
+            st.session_state.user = u
+            st.rerun()
+        else:
+            st.query_params.pop("token", None)
              
     if not st.session_state.logged_in:
         login_page()